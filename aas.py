@@ -17,8 +17,10 @@ import functools
 from collections import namedtuple, Counter
 from flask import Flask, render_template, redirect, request, url_for
 
+import asp
 import config as config_module
 import hashname
+import scheduler
 import aas_config as aasconfig_module
 import bakasp_backend
 from bakasp_backend import Backend
@@ -42,6 +44,8 @@ def gen_uid(cfg: dict, admin_password: bool = False) -> callable:
 def create_from_config(aas_config: dict, input_config: dict, period: str|float, uids: set, *, state: tuple = None, admin_uid: str = None) -> (str, InstanceControl, str):
     """Create the backend, return its uid, its instance, the InstanceControl instance, and the page to which the user must be redirected"""
     config, raw_config = validate_config(input_config)
+    if config is not None and not aas_config['meta']['save state']:
+        config['meta']['save state'] = False  # states of instances are only kept within the aas one
     if isinstance(uids, str):
         uid = uids
     else:  # uids is a set of already in-use uids
@@ -90,6 +94,8 @@ def create_from_form(aas_config: dict, title: str, period: str, uids: set, asp_f
             'choices': line_to_list(choiceline),
         },
     }
+    if utils.clingo is not None:  # instances of the same implementation may then share their ground programs
+        config['solver options'] = {'engine': 'ASP/clingo module', 'incremental': True}
     return create_from_config(aas_config, config, period, uids)
 
 
@@ -107,8 +113,13 @@ def validate_config(config_text: str) -> (dict or None, list[str]):
     return config_module.parse_configuration(config, filesource='browser', verify_and_normalize=True)
 
 
-def create_aas_app(configpath: str):
+def create_aas_app(configpath: str, *, meta: dict = None):
+    "Return the aas flask app ; given meta options override the ones of the configuration"
     aascfg, _ = aasconfig_module.parse_config_file(configpath)
+    aascfg['meta'].update(meta or {})
+    asp.THREAD_BUDGET.total = aascfg['server options']['solver threads']
+    scheduler.SCHEDULER.max_workers = aascfg['server options']['max concurrent compilations']
+    scheduler.SCHEDULER.fairness = aascfg['server options']['compilation fairness']
     bakasp_instances = {}  # uuid -> InstanceControl
     app = Flask(__name__, template_folder=os.path.join('templates/', aascfg['global options']['template']))
     filestate = utils.filestate_from_uid_and_cfg('aas', aascfg)
@@ -238,10 +249,20 @@ def create_aas_app(configpath: str):
             '#instances': len(bakasp_instances),
             **Counter('#instances deleted in '+c.period_label for c in bakasp_instances.values()),
             '#error instances': sum(1 for c in bakasp_instances.values() if c.haserror),
+            **scheduler.SCHEDULER.stats(),
+            **solver_statistics_totals(),
         }
         save_state()
         return render_template('aas-stats.html', stats=stats, root='/')
 
+    def solver_statistics_totals() -> dict:
+        "Return the statistics of compilations summed over running instances"
+        totals = sum((c.backend.statistics_totals for c in bakasp_instances.values() if not c.haserror), Counter())
+        return {
+            (name if name.startswith(('#', 'total ')) else 'total ' + name): utils.human_repr_of_runtime(value) if name.endswith(' time') else value
+            for name, value in sorted(totals.items())
+        }
+
     @app.route('/stats/all')
     def all_stats_page():
         instances = (
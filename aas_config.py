@@ -56,6 +56,9 @@ def parse_configuration(data:dict, *, filesource: str, verify: bool = True):
     set_default('server options', 'max instances', 0)
     set_default('server options', 'uid format', 'memorable')
     set_default('server options', 'statefile', 'memorable')
+    set_default('server options', 'solver threads', 0)
+    set_default('server options', 'max concurrent compilations', 4)
+    set_default('server options', 'compilation fairness', 'round robin')
     set_default('creation options', 'available times', 'all')
     set_default('creation options', 'available implementations', 'all')
     set_default('creation options', 'available choices types', 'all')
@@ -67,6 +70,8 @@ def parse_configuration(data:dict, *, filesource: str, verify: bool = True):
     # derivate values
     if data['server options']['max instances'] == -1:
         data['server options']['max instances'] = 0
+    if data['server options']['solver threads'] == 0:
+        data['server options']['solver threads'] = os.cpu_count() or 1
     if data['creation options']['available times'] == 'all':
         data['creation options']['available times'] = TIMES
     if data['creation options']['available implementations'] == 'all':
@@ -97,6 +102,7 @@ def errors_in_configuration(cfg: dict):
 
     ensure_in("server options", "uid format", {'short', 'long', 'memorable'})
     ensure_in("admin options", "password format", {'short', 'long', 'memorable'})
+    ensure_in("server options", "compilation fairness", {'round robin', 'weighted'})
 
     # type checking
     def ensure_is(key, subkey, *types):
@@ -104,6 +110,8 @@ def errors_in_configuration(cfg: dict):
             errors.append(f"{key} '{subkey}' is of invalid type: value {repr(val)} of type {type(val)}. Accepted types are {', '.join(map(repr, types))}")
 
     ensure_is('server options', 'max instances', int)
+    ensure_is('server options', 'solver threads', int)
+    ensure_is('server options', 'max concurrent compilations', int)
     ensure_is("meta", "load state", bool)
     ensure_is("meta", "save state", bool)
     ensure_is('creation options', 'available implementations', dict)
@@ -1,5 +1,86 @@
+import os
+import re
+import copy
 import utils
+import time
+import random
+import scheduler
+import threading
 import itertools
+from cache import LRUCache, key_of, as_tuples
+
+
+# encoding and solver options -> (found models, solving infos), shared by all instances of the process
+SOLVE_CACHE = LRUCache(
+    maxsize=2**20, weigh=lambda found: 1 + sum(map(len, found[0])),  # at most a million atoms in memory
+    directory='states/solve-cache/', disksize=256 * 2**20,  # at most 256MB on disk
+    dump=lambda found: {'models': [list(model) for model in found[0]], 'infos': found[1]},
+    load=lambda found: ([frozenset(as_tuples(model)) for model in found['models']], found['infos']),
+)
+
+# parallel solving profile name -> (clingo parallel mode, other clingo options)
+PARALLEL_PROFILES = {
+    'none': (None, []),
+    'compete': ('compete', []),
+    'split': ('split', []),
+    'portfolio': ('compete', ['--configuration=many']),
+}
+
+
+class ThreadBudget:
+    """Share a number of threads among the solvings running in the process.
+
+    A solving gets as many threads as wanted (all if zero), within the limit of free threads
+    and of its fair share of the budget, waiting for threads to be released if none is free.
+    The share is computed over the solvings running or waiting for threads,
+    or over the given demand, e.g. the number of compilations running or queued, if greater.
+
+    >>> budget = ThreadBudget(8, demand=lambda: 2)
+    >>> budget.acquire(0), budget.acquire(0)
+    (4, 4)
+    >>> budget.release(4); budget.acquire(2), budget.allocated
+    (2, 6)
+
+    """
+    def __init__(self, total: int, demand: callable = lambda: 0):
+        self.total, self.demand = total, demand
+        self.allocated, self.running, self.waiting = 0, 0, 0
+        self.condition = threading.Condition()
+
+    def acquire(self, wanted: int = 0) -> int:
+        demand = self.demand()  # outside of the condition, since it may use other locks
+        with self.condition:
+            self.waiting += 1
+            while self.allocated >= self.total:
+                self.condition.wait()
+            self.waiting -= 1
+            share = self.total // max(self.running + self.waiting + 1, demand)
+            threads = max(1, min(wanted or self.total, share, self.total - self.allocated))
+            self.allocated += threads
+            self.running += 1
+            return threads
+
+    def release(self, threads: int):
+        with self.condition:
+            self.allocated -= threads
+            self.running -= 1
+            self.condition.notify_all()
+
+# threads available for all the solvings of the process
+THREAD_BUDGET = ThreadBudget(os.cpu_count() or 1, demand=lambda: scheduler.SCHEDULER.demand())
+
+
+def choices_by_user(user_choices: dict or list) -> dict:
+    """Return given user choices as a mapping user -> choices list.
+
+    Choices of users that are not restricted are kept as a list, one per choices options,
+    with no known user, so that they produce no atom.
+
+    >>> choices_by_user({'a': [['1']]}), choices_by_user([{}])
+    ({'a': [['1']]}, {})
+
+    """
+    return user_choices if isinstance(user_choices, dict) else {}
 
 def atoms_from_choices(cfg: dict, user_choices: dict) -> str:
     for chop in cfg["choices options"]:
@@ -10,6 +91,16 @@ def atoms_from_choices(cfg: dict, user_choices: dict) -> str:
                     for choice in choices:
                         yield template.rstrip(".").format(user=user, choice=choice)+ '.'
 
+def atoms_from_user_choices(cfg: dict, user: str, choices_list: list) -> str:
+    "Return the atoms produced by choices of given user, as atoms_from_choices does"
+    atoms = atoms_from_choices(cfg, {user: choices_list})
+    return compact_facts(atoms) if cfg['solver options']['compact encoding'] else ''.join(atoms)
+
+def data_fragment(cfg: dict, user_choices: dict) -> str:
+    "Return the data atoms, as atoms_from_data does"
+    atoms = sorted(set(atoms_from_data(cfg, user_choices)))
+    return compact_facts(atoms) if cfg['solver options']['compact encoding'] else ''.join(atoms)
+
 def atoms_from_data(cfg: dict, user_choices: dict) -> [str]:
     # convert ranks to the values expected by ASP
     for chop in cfg["choices options"]:
@@ -39,17 +130,281 @@ def atoms_from_shows(cfg: dict) -> [str]:
     for show in shows:
         yield f'#show {show.rstrip(".")}.'
 
+# fact which arguments contain no quote, parenthesis or interval, and thus are easily split
+SIMPLE_FACT_REG = re.compile(r'^([a-z_]\w*)\(([^()"\.;]+)\)\.$')
+
+def compact_facts(facts: [str]) -> str:
+    """Return given facts as ASP, with facts differing only by their last argument merged in one pooled fact,
+    and consecutive integers of these arguments written as intervals.
+
+    Facts that are not simple enough are kept as is.
+
+    >>> compact_facts(['user(1).', 'user(2).', 'user(3).', 'user(5).', 'ok(a,1).', 'ok(a,b).', 'ok(a,2).', 'p.'])
+    'user(1..3;5).ok(a,1..2;a,b).p.'
+
+    """
+    groups, others = {}, []  # (predicate, first arguments) -> last arguments ; not simple facts
+    for fact in facts:
+        match = SIMPLE_FACT_REG.match(fact.strip())
+        if match:
+            pred, args = match.groups()
+            *first, last = (arg.strip() for arg in args.split(','))
+            groups.setdefault((pred, tuple(first)), {})[last] = None  # dict to keep order and remove duplicates
+        else:
+            others.append(fact)
+    compacted = []
+    for (pred, first), lasts in groups.items():
+        integers = sorted(int(arg) for arg in lasts if re.fullmatch(r'-?[1-9]\d*|0', arg))
+        terms = []
+        for _, run in itertools.groupby(enumerate(integers), key=lambda x: x[1] - x[0]):
+            run = [integer for _, integer in run]
+            terms.append(f'{run[0]}..{run[-1]}' if len(run) > 1 else str(run[0]))
+        terms += [arg for arg in lasts if not re.fullmatch(r'-?[1-9]\d*|0', arg)]
+        compacted.append(pred + '(' + ';'.join(','.join((*first, term)) for term in terms) + ').')
+    return ''.join(compacted) + ''.join(others)
+
 def compute_encoding(cfg: dict, user_choices: dict) -> str:
-    return cfg["global options"]["base encoding"] + ''.join(atoms_from_choices(cfg, user_choices)) + ''.join(atoms_from_shows(cfg)) + ''.join(set(atoms_from_data(cfg, user_choices)))
+    user_choices = choices_by_user(user_choices)
+    return cfg["global options"]["base encoding"] + ''.join(atoms_from_user_choices(cfg, user, choices_list) for user, choices_list in user_choices.items()) + ''.join(atoms_from_shows(cfg)) + data_fragment(cfg, user_choices)
+
+
+class EncodingBuilder:
+    """Build the same encoding as compute_encoding, reusing the fragments of previous builds.
+
+    Base and show fragments are computed once, the data fragment once per set of users,
+    and the fragment of each user only when its choices changed.
+
+    >>> cfg = {'global options': {'base encoding': 'base.', 'shows': []}, 'solver options': {'compact encoding': False},
+    ...        'choices options': [{'produced atoms': ['ok({user},{choice}).'], 'data atoms': ['user({user}).'], 'ranks': {}}]}
+    >>> builder = EncodingBuilder(cfg)
+    >>> builder.encoding({'a': [['1', '2']], 'b': [['3']]})
+    'base.ok(a,1).ok(a,2).ok(b,3).user(a).user(b).'
+    >>> builder.forget('b'); builder.encoding({'a': [['1', '2']], 'b': [['1']]})
+    'base.ok(a,1).ok(a,2).ok(b,1).user(a).user(b).'
+
+    """
+    def __init__(self, cfg: dict):
+        self.cfg = cfg
+        self.base = cfg["global options"]["base encoding"]
+        self.shows = ''.join(atoms_from_shows(cfg))
+        self.data = None, ''  # (users, data fragment)
+        self.fragments = {}  # user -> (choices the fragment was built from, fragment)
 
-def solve_encoding(cfg: dict, user_choices: dict):
-    encoding = compute_encoding(cfg, user_choices)
-    return utils.call_ASP_solver(
+    def forget(self, user: str):
+        "Drop the fragment of given user, because its choices changed"
+        self.fragments.pop(user, None)
+
+    def user_fragment(self, user: str, choices_list: list) -> str:
+        # choices are compared too, because they may change without forget being called, e.g. on state loading
+        choices, fragment = self.fragments.get(user, (None, None))
+        if choices != choices_list:
+            fragment = atoms_from_user_choices(self.cfg, user, choices_list)
+            self.fragments[user] = copy.deepcopy(choices_list), fragment
+        return fragment
+
+    def data_fragment(self, user_choices: dict) -> str:
+        users, fragment = self.data
+        if users != user_choices.keys():
+            fragment = data_fragment(self.cfg, user_choices)
+            self.data = frozenset(user_choices), fragment
+        return fragment
+
+    def encoding(self, user_choices: dict) -> str:
+        user_choices = choices_by_user(user_choices)
+        return self.base + ''.join(self.user_fragment(user, choices_list) for user, choices_list in user_choices.items()) + self.shows + self.data_fragment(user_choices)
+
+def solve_encoding(cfg: dict, user_choices: dict, *, session: object = None, infos: dict = None, encoding: str = None):
+    """Return the models of the encoding built from given configuration and user choices.
+
+    The encoding is computed, unless already given (e.g. by an EncodingBuilder).
+    If a SolvingSession is given, it is used instead of solving the encoding from scratch.
+    Given infos dict is filled with informations about the solving (see utils.anytime_models).
+
+    """
+    infos = {} if infos is None else infos
+    user_choices = choices_by_user(user_choices)
+    encoding = compute_encoding(cfg, user_choices) if encoding is None else encoding
+    sampling = cfg["output options"]["model selection"] == 'sampling'
+    run_solver = (lambda: session.solve(user_choices, infos)) if session else (lambda: solve(cfg, encoding, infos))
+    if not cfg['solver options']['cache'] or sampling:  # sampling is expected to give different models each time
+        return run_solver()
+    key = solve_key(cfg, encoding)
+    disk = cfg['solver options']['disk cache']
+    found = SOLVE_CACHE.get(key, disk=disk)
+    if found is None:
+        if cfg['output options']['streaming']:  # streamed models are not kept in memory, even in cache
+            return run_solver()
+        return recorded_in_cache(key, run_solver(), infos, disk=disk)
+    models, cached_infos = found
+    infos.update(cached_infos)
+    return iter(models)
+
+def recorded_in_cache(key: str, models: iter, infos: dict, *, disk: bool):
+    "Yield given models as they come, and keep them in cache once they are all found"
+    found = []
+    for model in models:
+        found.append(model)
+        yield model
+    if not infos.get('interrupted'):  # a solving stopped by its limits may do better next time
+        cached_infos = {name: value for name, value in infos.items() if name != 'statistics'}  # no solver work when found in cache
+        SOLVE_CACHE.set(key, (found, cached_infos), disk=disk)
+
+def solve_key(cfg: dict, encoding: str) -> str:
+    "Return the key identifying the models of given encoding with the solver options of given configuration"
+    return key_of(
         encoding,
+        cfg["output options"]["max models"],
+        cfg["output options"]["model selection"],
+        cfg['solver options']['engine'],
+        cfg['solver options']['cli'],
+        cfg['solver options']['constants'],
+        cfg['solver options']['solving mode'],
+    )
+
+def solve(cfg: dict, encoding: str, infos: dict = None):
+    infos = {} if infos is None else infos
+    options = dict(
         n=cfg["output options"]["max models"],
         sampling=cfg["output options"]["model selection"] == 'sampling',
-        cli_options=cfg['solver options']['cli'],
         constants=cfg['solver options']['constants'],
         optimals_only=cfg['solver options']['solving mode'] == 'optimals',
-        clingo_bin_path=cfg['solver options']['path'],
+        time_limit=cfg['solver options']['time limit'],
+        model_limit=cfg['solver options']['model limit'],
+        sampling_pool=cfg["output options"]["sampling pool"],
+        infos=infos,
     )
+    if cfg['solver options']['engine'] == 'ASP/clingo module':
+        solver = utils.call_clingo_module
+    else:  # default engine, calling the clingo binary
+        solver = lambda *args, **kwargs: utils.call_ASP_solver(*args, **kwargs, clingo_bin_path=cfg['solver options']['path'])
+    mode, profile_options = PARALLEL_PROFILES[cfg['solver options']['parallel']]
+    if mode is None:
+        return with_threads(cfg, infos, lambda threads: solver(encoding, cli_options=list(cfg['solver options']['cli']), **options))
+    return with_threads(cfg, infos, lambda threads: solver(
+        encoding, cli_options=[*cfg['solver options']['cli'], *profile_options, f'--parallel-mode={threads},{mode}'], **options
+    ))
+
+def with_threads(cfg: dict, infos: dict, solving: callable):
+    "Yield the models found by solving(threads), using threads taken from the budget of the process, only one if solving is not parallel"
+    if PARALLEL_PROFILES[cfg['solver options']['parallel']][0] is None:
+        threads = THREAD_BUDGET.acquire(1)
+    else:
+        threads = infos['threads'] = THREAD_BUDGET.acquire(cfg['solver options']['threads'])
+    try:
+        yield from solving(threads)
+    finally:
+        THREAD_BUDGET.release(threads)
+
+
+# solve-time setting of clingo configuration -> its group, set by each solving since ground programs are shared
+SOLVE_SETTINGS = {'models': 'solve', 'parallel_mode': 'solve', 'seed': 'solver', 'sign_def': 'solver', 'rand_freq': 'solver'}
+
+
+class GroundProgram:
+    "A grounded clingo Control object with its externals, usable by one solving at a time"
+    def __init__(self, ctl: object, externals: dict):
+        self.ctl, self.externals = ctl, externals  # produced atom -> clingo symbol
+        self.true_atoms = set()  # externals currently assigned to true, the others being false
+        self.defaults = {name: getattr(getattr(ctl.configuration, group), name) for name, group in SOLVE_SETTINGS.items()}
+        self.lock = threading.Lock()
+
+    def assign(self, chosen: set[str]):
+        "Set given atoms to true and the others to false, assigning only the externals whose value changes"
+        for atom in self.true_atoms - chosen:
+            self.ctl.assign_external(self.externals[atom], False)
+        for atom in chosen - self.true_atoms:
+            self.ctl.assign_external(self.externals[atom], True)
+        self.true_atoms = set(chosen)
+
+    def configure(self, **settings: str):
+        "Set given solve-time settings, and the others back to the values they had at creation"
+        for name, group in SOLVE_SETTINGS.items():
+            setattr(getattr(self.ctl.configuration, group), name, settings.get(name, self.defaults[name]))
+
+# ground programs, shared by the solving sessions of all instances of the process
+GROUND_CACHE = LRUCache(maxsize=32)
+
+
+class SolvingSession:
+    """Persistent clingo solving session, grounding the base encoding and data atoms only once.
+
+    Atoms produced from user choices are declared as externals,
+    so that a change of choices only changes their truth values before solving again.
+    The program is grounded again only when it could not represent the given choices,
+    for instance when new users appear.
+
+    Ground programs are shared among the sessions of the process that have the same
+    non-choice program and solver options, e.g. instances using the same implementation file
+    with the same users and choices. A session only keeps the key of its ground program,
+    so that programs are freed once GROUND_CACHE forgets them.
+
+    """
+
+    def __init__(self, cfg: dict):
+        self.cfg = cfg
+        self.ground_key, self.users = None, None
+
+    def possible_atoms_from_choices(self, user_choices: dict) -> set[str]:
+        "Return all the atoms that atoms_from_choices may produce with given users"
+        all_choices = {choice for chop in self.cfg["choices options"] for choice in chop["choices"].values()}
+        return {
+            template.rstrip(".").format(user=user, choice=choice) + '.'
+            for chop in self.cfg["choices options"]
+            for template in chop["produced atoms"]
+            for user in user_choices
+            for choice in all_choices
+        }
+
+    def ground(self, user_choices: dict, atoms: set[str]) -> GroundProgram:
+        solver_options = self.cfg['solver options']
+        program = self.cfg["global options"]["base encoding"] + ''.join(atoms_from_shows(self.cfg)) + data_fragment(self.cfg, user_choices)
+        options = (
+            self.cfg["output options"]["max models"],
+            [*solver_options['cli'], *PARALLEL_PROFILES[solver_options['parallel']][1]],
+            solver_options['constants'],
+            solver_options['solving mode'] == 'optimals',
+        )
+        self.ground_key = key_of(program, sorted(atoms), *options)
+        self.users = frozenset(user_choices)
+        ground_program = GROUND_CACHE.get(self.ground_key)
+        if ground_program is None:
+            ctl = utils.clingo_control(*options)
+            externals = {atom: utils.clingo.parse_term(atom.rstrip('.')) for atom in atoms}
+            ctl.add('base', [], program + ''.join('#external ' + atom for atom in externals))
+            ctl.ground([('base', [])])
+            ground_program = GroundProgram(ctl, externals)
+            GROUND_CACHE.set(self.ground_key, ground_program)
+        return ground_program
+
+    def solve(self, user_choices: dict, infos: dict = None) -> [frozenset]:
+        time_limit = self.cfg['solver options']['time limit']
+        deadline = (time.time() + time_limit) if time_limit else None  # grounding is counted, like the clingo binary does
+        chosen = set(atoms_from_choices(self.cfg, user_choices))
+        ground_program = None if self.ground_key is None else GROUND_CACHE.get(self.ground_key)
+        if ground_program is None or self.users != frozenset(user_choices) or not chosen <= ground_program.externals.keys():
+            ground_program = self.ground(user_choices, self.possible_atoms_from_choices(user_choices) | chosen)
+        return self.solving(ground_program, chosen, {} if infos is None else infos, deadline)
+
+    def solving(self, ground_program: GroundProgram, chosen: set[str], infos: dict, deadline: float = None) -> [frozenset]:
+        "Yield the models of given ground program with given atoms set to true, until given deadline, other sessions waiting meanwhile"
+        with ground_program.lock:
+            ground_program.assign(chosen)
+            n, sampling = self.cfg["output options"]["max models"], self.cfg["output options"]["model selection"] == 'sampling'
+            settings = {}  # those of this session, since other sessions may have changed them
+            if sampling and n:  # same randomization as utils.randomization_cli_options
+                settings = {'models': str(self.cfg["output options"]["sampling pool"]), 'seed': str(random.randrange(2**31)), 'sign_def': 'rnd', 'rand_freq': '0.2'}
+            solving = lambda: utils.models_from_control(
+                ground_program.ctl, n, sampling=sampling,
+                optimals_only=self.cfg['solver options']['solving mode'] == 'optimals',
+                deadline=deadline,
+                model_limit=self.cfg['solver options']['model limit'],
+                infos=infos,
+            )
+            mode = PARALLEL_PROFILES[self.cfg['solver options']['parallel']][0]
+            def solving_with_threads(threads: int):
+                if mode is None:
+                    ground_program.configure(**settings)
+                else:
+                    ground_program.configure(**settings, parallel_mode=f'{threads},{mode}')
+                return solving()
+            yield from with_threads(self.cfg, infos, solving_with_threads)
@@ -1,34 +1,146 @@
 
+import sys
+import numpy
 import hashname
-import model_repr
+from array import array
+from collections import Counter
 from flask import Markup
+from cache import LRUCache, key_of
+
+
+# (model repr configuration, index, atoms) -> html of the model, shared by all instances of the process
+HTML_CACHE = LRUCache(maxsize=64 * 2**20, weigh=len)  # at most 64M characters
+
+
+class SymbolTable:
+    """Atoms interned once for all the models of a compilation, so that each model is only an array of atom ids
+
+    >>> symbols = SymbolTable()
+    >>> symbols.ids_of([('a', (1,)), ('b', ('x', 'y'))]), symbols.ids_of([('b', ('x', 'y'))])
+    (array('I', [0, 1]), array('I', [1]))
+    >>> symbols.atoms_of(array('I', [1, 0]))
+    (('b', ('x', 'y')), ('a', (1,)))
+
+    """
+
+    def __init__(self):
+        self.atoms = []  # atom id -> (predicate, args)
+        self.ids = {}  # (predicate, args) -> atom id
+
+    def ids_of(self, atoms: [tuple]) -> array:
+        ids = array('I')
+        for atom in atoms:
+            atom_id = self.ids.get(atom)
+            if atom_id is None:
+                atom_id = self.ids[atom] = len(self.atoms)
+                self.atoms.append(interned(atom))
+            ids.append(atom_id)
+        return ids
+
+    def atoms_of(self, ids: array) -> tuple:
+        return tuple(map(self.atoms.__getitem__, ids))
+
+
+def interned(value: object) -> object:
+    "Return given atom, predicate or argument, with its strings interned, so that equal constants are stored once"
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, tuple):
+        return tuple(map(interned, value))
+    return value
 
 
 class ShowableModel:
-    "Wrapper around clyngor ASP model, with specific informations in it"
+    """Wrapper around clyngor ASP model, with specific informations in it
+
+    Atoms are stored as ids in given symbol table, shared by the models of a compilation,
+    and given back as the (predicate, args) pairs of model_stable_repr by the atoms attribute.
+
+    Atoms are also indexed by predicate and arity on first call to args_of(), so that
+    plugins look for the atoms they need without scanning all of them.
+
+    If given, repr_key identifies the configuration of repr_funcs, which must then depend
+    only on the model and its index. The html of the model is then cached in HTML_CACHE,
+    and reused by the next page views and compilations yielding the same model at the same index.
+    The html may also be rendered in advance, e.g. by worker threads, and given with set_html().
 
-    def __init__(self, idx: int, clyngor_model: frozenset, repr_funcs: list[callable], show_uid: bool):
-        self.atoms = model_stable_repr(clyngor_model)
-        self.uid = hashname.from_obj(self.atoms) if show_uid else None
+    """
+    __slots__ = ('atom_ids', 'symbols', 'uid', 'idx', 'repr_funcs', 'repr_key', 'html_key', 'html', 'predicate_index')
+
+    def __init__(self, idx: int, clyngor_model: frozenset, repr_funcs: list[callable], show_uid: bool, symbols: SymbolTable = None, repr_key: str = None, uid: str = None):
+        atoms = model_stable_repr(clyngor_model)
+        self.symbols = SymbolTable() if symbols is None else symbols
+        self.atom_ids = self.symbols.ids_of(atoms)
+        self.uid = (hashname.from_atoms(atoms) if uid is None else uid) if show_uid else None
         self.idx, self.repr_funcs = idx, tuple(repr_funcs)
+        self.repr_key, self.html_key = repr_key, None  # key in HTML_CACHE, computed on first rendering
+        self.html = None  # html rendered in advance, if any
+        self.predicate_index = None  # (predicate, arity) -> args of the atoms, computed on first query
+
+    @property
+    def atoms(self) -> tuple:
+        return self.symbols.atoms_of(self.atom_ids)
+
+    def __len__(self) -> int:
+        return len(self.atom_ids)
+
+    def args_of(self, predicate: str, arity: int) -> tuple:
+        """Return the args of the atoms of given predicate and arity, in the order of the atoms
+
+        >>> model = ShowableModel(1, [('a', (2,)), ('b', ()), ('a', (1,)), ('a', (1, 2))], [], False)
+        >>> model.args_of('a', 1), model.args_of('a', 2), model.args_of('c', 1)
+        (((1,), (2,)), ((1, 2),), ())
+        >>> list(model.index())
+        [('a', 1), ('a', 2), ('b', 0)]
+
+        """
+        return self.index().get((predicate, arity), ())
+
+    def index(self) -> dict:
+        "Return the mapping (predicate, arity) -> args of the atoms, built once for the model"
+        if self.predicate_index is None:
+            index = {}
+            for pred, args in self.atoms:
+                index.setdefault((pred, len(args)), []).append(args)
+            self.predicate_index = {signature: tuple(argss) for signature, argss in index.items()}
+        return self.predicate_index
 
     def html_repr(self):
+        html = self.cached_html()
+        if html is None:
+            html = self.render_html()
+            if self.repr_key is not None:
+                HTML_CACHE.set(self.html_key, html)
+        return html
+
+    def cached_html(self) -> Markup or None:
+        "Return the html rendered in advance, or found in HTML_CACHE, if any"
+        if self.html is not None or self.repr_key is None:
+            return self.html
+        if self.html_key is None:
+            self.html_key = key_of(self.repr_key, self.idx, self.atoms)
+        return HTML_CACHE.get(self.html_key)
+
+    def set_html(self, html: Markup):
+        "Keep given html rendered in advance, returned by next calls to html_repr"
+        self.html = html
+        if self.repr_key is not None:
+            if self.html_key is None:
+                self.html_key = key_of(self.repr_key, self.idx, self.atoms)
+            HTML_CACHE.set(self.html_key, html)
+
+    def render_html(self):
         # Markup is necessary for flask to render the html, instead of just writing it as-is
         return Markup(''.join(func(self.idx, self.uid, self) for func in self.repr_funcs))
 
     @staticmethod
     def intersection(models: iter):
-        models = iter(models)
-        base_model = next(models, None)
-        acc = {}
-        if base_model is None:
+        "Return the model made of the atoms common to all given models"
+        models = tuple(models)
+        if not models:
             return ShowableModel(-1, frozenset(), [], show_uid=False)
-        for pred, args in base_model.atoms:
-            acc.setdefault(pred, set()).add(args)
-        for model in models:
-            for pred, args in model.atoms:
-                acc[pred] &= set(args)
-        return ShowableModel(-1, acc, base_model.repr_funcs, show_uid=False)
+        aggregate = ModelsAggregate(models)
+        return ShowableModel(-1, frozenset(aggregate.intersection()), models[0].repr_funcs, show_uid=False, symbols=aggregate.symbols)
 
     def __gt__(self, othr):
         if isinstance(othr, ShowableModel):
@@ -42,6 +154,52 @@ class ShowableModel:
             return NotImplemented
 
 
+class ModelsAggregate:
+    """Frequency of each atom among given models, from which union, intersection and counts of atoms are derived.
+
+    Atoms are indexed once in the symbol table shared by the models, or in a new one
+    if they don't share one, and the frequencies are computed by a single vectorized count
+    over the atom ids of all models.
+
+    >>> models = [ShowableModel(idx, [('a', (1,)), ('b', (2,))], [], False) for idx in range(2)] + [ShowableModel(2, [('a', (1,)), ('a', (3,))], [], False)]
+    >>> aggregate = ModelsAggregate(models)
+    >>> sorted(aggregate.union()), aggregate.intersection(), aggregate.frequency(('b', (2,)))
+    ([('a', (1,)), ('a', (3,)), ('b', (2,))], [('a', (1,))], 2)
+    >>> aggregate.counts_by_predicate()
+    Counter({'a/1': 2, 'b/1': 1})
+
+    """
+
+    def __init__(self, models: [ShowableModel]):
+        self.nb_models = len(models)
+        symbols = {id(model.symbols): model.symbols for model in models}
+        if len(symbols) == 1:  # models of one compilation
+            self.symbols = next(iter(symbols.values()))
+            ids = [model.atom_ids for model in models]
+        else:
+            self.symbols = SymbolTable()
+            ids = [self.symbols.ids_of(model.atoms) for model in models]
+        all_ids = numpy.concatenate([numpy.frombuffer(model_ids, dtype=numpy.uintc) for model_ids in ids]) if ids else numpy.array([], dtype=numpy.uintc)
+        self.frequencies = numpy.bincount(all_ids, minlength=len(self.symbols.atoms))  # atom id -> number of models containing it
+
+    def atoms_where(self, mask: numpy.ndarray) -> list[tuple]:
+        return [self.symbols.atoms[atom_id] for atom_id in numpy.flatnonzero(mask)]
+
+    def union(self) -> list[tuple]:
+        return self.atoms_where(self.frequencies > 0)
+
+    def intersection(self) -> list[tuple]:
+        return self.atoms_where(self.frequencies == self.nb_models) if self.nb_models else []
+
+    def frequency(self, atom: tuple) -> int:
+        atom_id = self.symbols.ids.get(atom)
+        return 0 if atom_id is None or atom_id >= len(self.frequencies) else int(self.frequencies[atom_id])
+
+    def counts_by_predicate(self) -> Counter:
+        "Return the number of different atoms found for each predicate/arity"
+        return Counter(f'{pred}/{len(args)}' for pred, args in self.union())
+
+
 def model_stable_repr(model: frozenset) -> tuple:
     """Return the same model, only everything is ordered so that models
     with exact same atoms get the exact same representation.
@@ -1,15 +1,22 @@
 """Functions implementing the bakasp internal logic"""
 
 import os
+import copy
 import json
 import time
-from functools import lru_cache
-from flask import redirect, render_template, Markup, request
+import threading
+import itertools
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from flask import redirect, render_template, stream_template, Markup, request, has_request_context
+from cache import key_of
 
 import utils
+import hashname
+import scheduler
 import model_repr
-from asp_model import ShowableModel
-from asp import solve_encoding, compute_encoding
+from asp_model import ShowableModel, SymbolTable, model_stable_repr
+from asp import solve_encoding, EncodingBuilder, SolvingSession
 
 
 # Link between user choice range and the HTML template that the front must expose
@@ -21,11 +28,29 @@ RANGES_TO_TEMPLATES = {  # those who have the same name don't have to be specifi
 CHOICES_TO_TEMPLATES = {
     'multiple users': 'multiple',
 }
+# weight of a compilation for the scheduler when there is no limit to the number of models
+UNLIMITED_MODELS_WEIGHT = 100
+# workers rendering models of all instances with the parallel rendering option, and number of models given to each task
+RENDERING_POOL = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1), thread_name_prefix='bakasp-rendering')
+RENDERING_CHUNK_SIZE = 32
 
 def get_empty_state():
     return [{}, set(), []]
 
 
+def names_by_uid(names_and_uids: iter) -> dict:
+    """Return uid -> name, keeping the first name of each uid, uids being compared as strings
+
+    >>> names_by_uid([('ada', 1), ('lucas', '2'), ('lovelace', '1')])
+    {'1': 'ada', '2': 'lucas'}
+
+    """
+    names = {}
+    for name, uid in names_and_uids:
+        names.setdefault(str(uid), name)
+    return names
+
+
 class ErrorBackend:
     def __init__(self, uid: str, admin_uid: str, errors: list, raw_config: dict):
         self.uid, self.admin_uid = uid, admin_uid
@@ -45,18 +70,34 @@ class Backend:
     @property
     def haserror(self) -> bool: return False
 
-    def __init__(self, uid: str, admin_uid: str, cfg: dict, raw_cfg: dict, *, rootpath: str = '/', render_template_func: callable = render_template):
+    def __init__(self, uid: str, admin_uid: str, cfg: dict, raw_cfg: dict, *, rootpath: str = '/', render_template_func: callable = render_template, stream_template_func: callable = stream_template):
         """Expect the configuration to be valid"""
         self.uid, self.admin_uid = (uid or ''), (admin_uid or '')
         self.root = rootpath.format(uid=self.uid)
         self.template_folder = os.path.join('templates/', cfg['global options']['template'])
         self.users_who_changed_their_choices = set()
         self.models = []  # list of all found models
+        self.models_uid = set()  # uids of found models at last compilation
         self.result_header, self.result_footer = '', ''  # header and footer of the result page
-        self.history = []  # (datetime, userids -> choices, new_models, lost_models)
+        self.history = []  # (datetime, userids -> choices, new_models, lost_models, compilation statistics)
         self.previous_models_uid = set()  # uids of found models before last compilation
+        self.generation = 0  # number of compilations done since start
+        self.compilation_lock = threading.Lock()  # only one compilation at a time
+        self.choices_lock = threading.Lock()  # user choices and users who changed them are modified together
+        self.background_lock = threading.Lock()  # only one background compilation started at a time
+        self.background_compilation = None  # future of the last background compilation
+        self.forced_compilation_pending = False  # True if the scheduled compilation must be forced
+        self.auto_compilation_timer = None  # timer starting the compilation once choices stop changing
+        self.solving_infos = {}  # infos about the solving of last compilation
+        self.statistics_totals = Counter()  # sum of the statistics of all compilations since start
         self.cfg, self.raw_cfg = cfg, raw_cfg
-        self.render_template = render_template_func
+        self.render_template, self.stream_template = render_template_func, stream_template_func
+        self.solving_session = SolvingSession(cfg) if cfg['solver options']['incremental'] else None
+        self.encoding_builder = EncodingBuilder(cfg)
+        # userid or choiceid -> its name, the first one given by the configuration if many
+        users = cfg["users options"]["allowed"]
+        self.usernames = names_by_uid(users.items() if isinstance(users, dict) else zip(users, users))
+        self.choicenames = names_by_uid(item for chop in cfg["choices options"] for item in chop["choices"].items())
 
         # initialize state
         self.filestate = utils.filestate_from_uid_and_cfg(self.uid, self.cfg)
@@ -75,6 +116,9 @@ class Backend:
         )
         self.header_repr_plugins = tuple(model_repr.gen_model_repr_plugins(cfg['output options']['header repr'], self.get_username_of, self.get_choicename_of)) + self.plugin_repr_plugins
         self.footer_repr_plugins = tuple(model_repr.gen_model_repr_plugins(cfg['output options']['footer repr'], self.get_username_of, self.get_choicename_of)) + self.plugin_repr_plugins
+        # models html depends only on their repr configuration, unless plugins render them according to all models.
+        # Streamed models are not kept in memory, so neither is their html.
+        self.model_repr_key = None if self.plugin_repr_plugins or cfg['output options']['streaming'] else key_of(cfg['output options'], cfg['users options'], cfg['choices options'])
 
 
     def init_user_choices(self):
@@ -102,7 +146,7 @@ class Backend:
     @state.setter
     def state(self, state: [dict, set|list, list]):
         a, b, c = state
-        a, b, c = dict(a), set(b), list(c)
+        a, b, c = dict(a), set(b), [(*entry, {})[:5] for entry in c]  # statistics are missing from older histories
         self.user_choices, self.previous_models_uid, self.history = a, b, c
 
     def load_state(self):
@@ -121,24 +165,15 @@ class Backend:
         self.state = loaded
 
 
-    # @lru_cache(maxsize=len(cfg["users options"]["allowed"]) if cfg["users options"]["type"] == 'restricted' else 1024)
     def get_username_of(self, targetid: str) -> str or None:
-        users = self.cfg["users options"]["allowed"]
-        for username, userid in users.items() if isinstance(users, dict) else zip(users, users):
-            if str(userid) == str(targetid):
-                return username
-        return None
+        return self.usernames.get(str(targetid))
 
     def get_choicename_of(self, targetid: str) -> str or None:
-        for chop in self.cfg["choices options"]:
-            for name, uid in chop["choices"].items():
-                if str(uid) == str(targetid):
-                    return name
-        return None
+        return self.choicenames.get(str(targetid))
 
 
-    def create_asp_model(self, idx: int, clyngor_model: frozenset) -> ShowableModel:
-        return ShowableModel(idx, clyngor_model, (p.repr_model for p in self.model_repr_plugins), show_uid=self.cfg['output options']['show human-readable id'])
+    def create_asp_model(self, idx: int, clyngor_model: frozenset, symbols: SymbolTable = None, uid: str = None) -> ShowableModel:
+        return ShowableModel(idx, clyngor_model, (p.repr_model for p in self.model_repr_plugins), show_uid=self.cfg['output options']['show human-readable id'], symbols=symbols, repr_key=self.model_repr_key, uid=uid)
 
 
     def user_choice_repr_from_request_form(self, form) -> set:
@@ -149,38 +184,209 @@ class Backend:
             raise NotImplementedError(f"Form output of type {type(form)} is not handled. Value is: {repr(form)}")
 
 
+    def iter_models(self, user_choices: dict, infos: dict = None) -> [ShowableModel]:
+        "Yield models found for given choices as soon as possible, in solver order unless sorting is asked"
+        encoding = self.encoding_builder.encoding(user_choices)
+        models = solve_encoding(self.cfg, user_choices, session=self.solving_session, infos=infos, encoding=encoding)
+        if self.cfg['output options']['sort models']:
+            models = sorted(models, key=model_stable_repr)
+        uids = itertools.repeat(None)  # computed by each model
+        if self.cfg['output options']['show human-readable id'] and not self.cfg['output options']['streaming']:
+            models = [model_stable_repr(model) for model in models]  # all models are waited for anyway
+            uids = hashname.from_atoms_batch(models)
+        symbols = SymbolTable()  # shared by the models of this compilation
+        for idx, model, uid in zip(itertools.count(1), models, uids):
+            yield self.create_asp_model(idx, model, symbols, uid)
+
+    def render_header_and_footer(self, stats: dict) -> (Markup, Markup):
+        header = Markup(''.join(p.repr_header(**stats) for p in self.header_repr_plugins))
+        if stats['solving_interrupted']:
+            header = Markup(self.cfg['output options']['interruption message']) + Markup('<br/>') + header
+        footer = Markup(''.join(p.repr_footer(**stats) for p in self.footer_repr_plugins))
+        return header, footer
+
+    def render_models(self, models: [ShowableModel], concurrently: callable = lambda: None) -> object:
+        """Render the html of given models not rendered yet nor found in HTML_CACHE, in chunks sent to the rendering workers,
+        while calling concurrently in this thread. Return what it returned.
+
+        Plugins that are not pure are rendered once concurrently returned, in this thread,
+        since they may depend on what header and footer rendering computed.
+
+        """
+        models = [model for model in models if model.cached_html() is None]
+        chunks = [models[start:start + RENDERING_CHUNK_SIZE] for start in range(0, len(models), RENDERING_CHUNK_SIZE)]
+        futures = [RENDERING_POOL.submit(self.render_pure_parts, chunk) for chunk in chunks]
+        result = concurrently()
+        for chunk, future in zip(chunks, futures):
+            for model, parts in zip(chunk, future.result()):
+                model.set_html(Markup(''.join(
+                    plugin.repr_model(model.idx, model.uid, model) if part is None else part
+                    for plugin, part in zip(self.model_repr_plugins, parts)
+                )))
+        return result
+
+    def render_pure_parts(self, models: [ShowableModel]) -> [[str or None]]:
+        "Return, for each given model, the html rendered by each pure plugin, or None for the others"
+        return [[plugin.repr_model(model.idx, model.uid, model) if plugin.PURE else None for plugin in self.model_repr_plugins] for model in models]
+
     def compile_models(self, force_compilation: bool = False) -> float:
         "return runtime"
-        starttime = time.time()
-        # self.users_who_changed_their_choices
-        if not self.users_who_changed_their_choices and not force_compilation:
-            return 0.
-        self.previous_models_uid = {m.uid for m in self.models}  # remember previous uids
-        self.models = []
-        for idx, model in enumerate(sorted(list(solve_encoding(self.cfg, self.user_choices))), start=1):
-            self.models.append(self.create_asp_model(idx, model))
-        self.save_history(force_save=force_compilation)
-        stats = {}
-        stats['models'] = list(self.models)
-        stats['nb_models'] = len(self.models)
-        stats['compilation_runtime'] = time.time() - starttime
-        stats['compilation_runtime_repr'] = utils.human_repr_of_runtime(stats['compilation_runtime'])
-        self.result_header = Markup(''.join(p.repr_header(**stats) for p in self.header_repr_plugins))
-        self.result_footer = Markup(''.join(p.repr_footer(**stats) for p in self.footer_repr_plugins))
-        return stats['compilation_runtime']
+        with self.compilation_lock:
+            starttime = time.time()
+            if not self.users_who_changed_their_choices and not force_compilation:
+                return 0.
+            changed_users, user_choices = self.take_changes()
+            try:
+                infos = {}
+                models = list(self.iter_models(user_choices, infos))
+                stats = {}
+                stats['models'] = list(models)
+                stats['nb_models'] = len(models)
+                stats['compilation_runtime'] = time.time() - starttime
+                stats['compilation_runtime_repr'] = utils.human_repr_of_runtime(stats['compilation_runtime'])
+                stats['solving_interrupted'] = infos.get('interrupted', False)
+                stats['optimality_proven'] = infos.get('optimality proven')
+                stats['solver_statistics'] = self.compilation_statistics(infos, stats['compilation_runtime'])
+                if self.cfg['output options']['parallel rendering']:  # models of the first page are rendered while header and footer are
+                    first_page = self.results_pagination(len(models), from_request=False)
+                    header, footer = self.render_models(models[:first_page['limit'] or None], concurrently=lambda: self.render_header_and_footer(stats))
+                else:
+                    header, footer = self.render_header_and_footer(stats)
+                self.previous_models_uid, self.models_uid = self.models_uid, {m.uid for m in models}  # remember previous uids
+                self.models, self.result_header, self.result_footer = models, header, footer
+                self.generation += 1
+                self.solving_infos = infos
+            except BaseException:
+                self.restore_changes(changed_users)
+                raise
+            self.save_history(changed_users, stats['solver_statistics'], force_save=force_compilation)
+            return stats['compilation_runtime']
+
+    def compilation_statistics(self, infos: dict, runtime: float) -> dict:
+        """Return the statistics of a compilation of given runtime, from the solver ones found in given solving infos.
+
+        The python time is the time not spent in the solver, e.g. wrapping models.
+        Solver statistics are missing when the models were found in cache.
+
+        """
+        statistics = dict(infos.get('statistics', {}))
+        statistics['compilation time'] = runtime
+        statistics['python time'] = max(0., runtime - statistics.get('total time', 0.))
+        if 'optimality proven' in infos:  # only known in optimals solving mode
+            statistics['optimality proven'] = infos['optimality proven']
+        if infos.get('interrupted'):
+            statistics['interrupted'] = True
+        self.statistics_totals.update({name: value for name, value in statistics.items() if not isinstance(value, bool)})
+        self.statistics_totals['#compilations'] += 1
+        return statistics
+
+    def stream_compiled_models(self, stats: dict) -> [ShowableModel]:
+        """Compile the models, yielding them as soon as they are found.
+
+        Models are not kept in memory, only their uids are. Given stats dict
+        is filled at the end, so the header and footer can be rendered after the models.
+
+        """
+        with self.compilation_lock:
+            starttime = time.time()
+            changed_users, user_choices = self.take_changes()
+            models_uid, nb_models, infos = set(), 0, {}
+            try:
+                for model in self.iter_models(user_choices, infos):
+                    models_uid.add(model.uid)
+                    nb_models += 1
+                    yield model
+            except BaseException:  # including the client leaving before the end
+                self.restore_changes(changed_users)
+                raise
+            stats['models'] = ()
+            stats['nb_models'] = nb_models
+            stats['compilation_runtime'] = time.time() - starttime
+            stats['compilation_runtime_repr'] = utils.human_repr_of_runtime(stats['compilation_runtime'])
+            stats['solving_interrupted'] = infos.get('interrupted', False)
+            stats['optimality_proven'] = infos.get('optimality proven')
+            stats['solver_statistics'] = self.compilation_statistics(infos, stats['compilation_runtime'])
+            self.previous_models_uid, self.models_uid = self.models_uid, models_uid
+            self.models = []
+            self.generation += 1
+            self.solving_infos = infos
+            self.save_history(changed_users, stats['solver_statistics'])
+
+    def take_changes(self) -> (set, dict):
+        """Return the users who changed their choices since last compilation, and a copy of the choices to compile.
+
+        Users are forgotten, so that those changing their choices during the compilation are compiled by the next one.
+
+        """
+        with self.choices_lock:
+            changed_users, self.users_who_changed_their_choices = self.users_who_changed_their_choices, set()
+            return changed_users, copy.deepcopy(self.user_choices)
+
+    def restore_changes(self, changed_users: set):
+        "Remember given users as still to compile, because their compilation failed"
+        with self.choices_lock:
+            self.users_who_changed_their_choices |= changed_users
+
+    def schedule_compilation(self, force_compilation: bool = False) -> 'Future':
+        "Ask the process scheduler to compile, return the future of its runtime"
+        self.forced_compilation_pending |= force_compilation
+        weight = self.cfg['output options']['max models'] or UNLIMITED_MODELS_WEIGHT
+        return scheduler.SCHEDULER.submit(self, self.run_scheduled_compilation, weight)
+
+    def run_scheduled_compilation(self) -> float:
+        force_compilation, self.forced_compilation_pending = self.forced_compilation_pending, False
+        return self.compile_models(force_compilation)
+
+    def compile_models_in_background(self, force_compilation: bool = False) -> bool:
+        "Start the compilation in a worker if needed, return True if a compilation is running"
+        with self.background_lock:
+            if self.recomputing:
+                return True
+            if not self.users_who_changed_their_choices and not force_compilation:
+                return False
+            self.background_compilation = self.schedule_compilation(force_compilation)
+            self.background_compilation.add_done_callback(self.report_background_error)
+            return True
+
+    def report_background_error(self, future: 'Future'):
+        if future.exception():
+            print(f"ERROR during background compilation of instance {self.uid}: {future.exception()}")
+
+    def schedule_auto_compilation(self):
+        "Restart the countdown to the compilation of all changes, if auto compilation is enabled"
+        delay = self.cfg['global options']['auto compilation delay']
+        if not delay:
+            return
+        with self.background_lock:
+            if self.auto_compilation_timer is not None:
+                self.auto_compilation_timer.cancel()
+            self.auto_compilation_timer = threading.Timer(delay, self.run_auto_compilation)
+            self.auto_compilation_timer.daemon = True
+            self.auto_compilation_timer.start()
+
+    def run_auto_compilation(self):
+        "Compile all changes since last compilation, after the running compilation if any since it may miss some of them"
+        with self.background_lock:
+            if self.users_who_changed_their_choices:
+                self.background_compilation = self.schedule_compilation()
+                self.background_compilation.add_done_callback(self.report_background_error)
+
+    @property
+    def recomputing(self) -> bool:
+        return self.background_compilation is not None and not self.background_compilation.done()
 
 
-    def save_history(self, force_save: bool = False):
+    def save_history(self, changed_users: set, statistics: dict = None, force_save: bool = False):
         # NB: for this to work correctly, compilation must have been done just before
-        if self.users_who_changed_their_choices or force_save:
-            models_uid = set(m.uid for m in self.models)
+        if changed_users or force_save:
+            models_uid = self.models_uid
             self.history.append((
                 time.strftime(self.cfg['history options']['time format'], time.localtime()),
-                sorted(list(self.users_who_changed_their_choices)) + (['autocompile'] if force_save else []),
+                sorted(list(changed_users)) + (['autocompile'] if force_save else []),
                 sorted(list(models_uid - self.previous_models_uid)),
-                sorted(list(self.previous_models_uid - models_uid))
+                sorted(list(self.previous_models_uid - models_uid)),
+                {} if statistics is None else statistics,
             ))
-            self.users_who_changed_their_choices = set()
 
 
     def html_instance_page(self, *, admin: str = None, remaining_instance_time: str = None):
@@ -262,8 +468,11 @@ class Backend:
     def set_user_choice(self, userid, choiceid, form):
         choiceid = int(choiceid)
         username = self.get_username_of(userid) or "Unknown"
-        self.user_choices[userid][choiceid] = list(self.user_choice_repr_from_request_form(form))  # keep list, because we need json serializable data
-        self.users_who_changed_their_choices.add(username)
+        with self.choices_lock:
+            self.user_choices[userid][choiceid] = list(self.user_choice_repr_from_request_form(form))  # keep list, because we need json serializable data
+            self.users_who_changed_their_choices.add(username)
+        self.encoding_builder.forget(userid)
+        self.schedule_auto_compilation()
         if 1+int(choiceid) < len(self.cfg['choices options']):  # is there more choices to do ?
             return redirect(f'{self.root}user/{userid}/{choiceid+1}')  # +1 because index starts at 1 in URLs, and +1 to get to next choice
         else:  # its the last choice to make for this user
@@ -282,7 +491,7 @@ class Backend:
 
     def html_compilation(self, *, admin: str = None):
         if self.accepts('compilation', admin):
-            runtime = self.compile_models(force_compilation=True)
+            runtime = self.schedule_compilation(force_compilation=True).result()
             return f"done in {runtime}s"
         else:
             return self.render_template('admin-access-required.html', root=self.root)
@@ -295,20 +504,52 @@ class Backend:
 
     def html_overview(self, *, admin: str = None):
         if self.accepts('overview', admin):
-            return repr(self.user_choices) + '<br/>' + repr(self.cfg["users options"]["allowed"]) + '<br/>' + repr([chop["choices"] for chop in self.cfg["choices options"]]) + '<br/><br/>Encoding:\n<code>' + compute_encoding(self.cfg, self.user_choices) + '</code><br/>' + repr(self.history)
+            return repr(self.user_choices) + '<br/>' + repr(self.cfg["users options"]["allowed"]) + '<br/>' + repr([chop["choices"] for chop in self.cfg["choices options"]]) + '<br/><br/>Encoding:\n<code>' + self.encoding_builder.encoding(self.user_choices) + '</code><br/>' + repr(self.history)
         else:
             return self.render_template('admin-access-required.html', root=self.root)
 
     def html_results(self, *, admin: str = None):
         if self.accepts('results', admin):
+            if self.cfg["output options"]["streaming"]:
+                return self.html_streamed_results()
             if self.cfg["global options"]["compilation"] == 'direct access':
-                self.compile_models()
-            return self.render_template('results.html', models=self.models, header=self.result_header, footer=self.result_footer,
-                                   message=self.cfg["output options"]["insatisfiability message"] if not self.models else "",
+                if self.users_who_changed_their_choices:
+                    self.schedule_compilation().result()
+            elif self.cfg["global options"]["compilation"] == 'background access':
+                self.compile_models_in_background()
+            recomputing = self.recomputing
+            models = self.models  # header and footer were rendered with all of them
+            pagination = self.results_pagination(len(models))
+            if pagination['limit']:  # only the models of the page are rendered
+                models = models[(pagination['page'] - 1) * pagination['limit']:pagination['page'] * pagination['limit']]
+            if self.cfg['output options']['parallel rendering']:
+                self.render_models(models)
+            return self.render_template('results.html', models=models, header=self.result_header, footer=self.result_footer,
+                                   message=self.cfg["output options"]["insatisfiability message"] if not self.models and not recomputing else "",
+                                   recomputing=recomputing, generation=self.generation, pagination=pagination,
                                    root=self.root)
         else:
             return self.render_template('admin-access-required.html', root=self.root)
 
+    def results_pagination(self, nb_models: int, from_request: bool = True) -> dict:
+        "Return the page, number of pages and number of models per page (0 for all) asked by the current request, if any"
+        limit, page = self.cfg['output options']['models per page'], 1
+        if from_request and has_request_context():  # invalid values are replaced by the defaults
+            limit = request.args.get('limit', limit, type=int)
+            page = request.args.get('page', page, type=int)
+        limit = max(0, limit)
+        nb_pages = max(1, -(-nb_models // limit)) if limit else 1
+        return {'page': min(max(1, page), nb_pages), 'nb_pages': nb_pages, 'limit': limit}
+
+    def html_streamed_results(self):
+        "Send the models while they are found, header and footer being rendered after them"
+        stats = {}
+        models = self.stream_compiled_models(stats)
+        header_and_footer = utils.Lazy(lambda: ''.join(self.render_header_and_footer(stats)))
+        return self.stream_template('results.html', models=models, header='', footer=header_and_footer,
+                                    message='', recomputing=False, generation=self.generation + 1, pagination=None,
+                                    root=self.root)
+
     def html_admin_access_required(self):
         return self.render_template('admin-access-required.html', root=self.root)
 
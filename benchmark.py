@@ -0,0 +1,166 @@
+"""Measure the time spent in each phase of a compilation, for growing numbers of users.
+
+Each example configuration and each ASP file of data/asp/ is run with synthesized
+users and choices, at each of the given scales. Results are written as json,
+and may be compared with the results of a previous run.
+
+"""
+
+import os
+import copy
+import glob
+import json
+import time
+import random
+import argparse
+import platform
+
+import asp
+import config
+import hashname
+from asp_model import SymbolTable
+from bakasp_backend import Backend
+
+
+PHASES = ('parsing', 'encoding', 'solving', 'models', 'rendering')
+
+
+def parse_cli() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('sources', nargs='*', type=str, help='json configurations or ASP files to benchmark, all examples and data/asp/ files by default')
+    parser.add_argument('--scales', '-s', nargs='+', type=int, help='numbers of users to benchmark', default=[10, 100, 1000, 10000])
+    parser.add_argument('--choices-per-user', '-c', type=int, help='number of random choices of each user', default=3)
+    parser.add_argument('--max-models', '-n', type=int, help='max models option of all configurations', default=10)
+    parser.add_argument('--time-limit', '-t', type=int, help='solving time limit of all configurations, in seconds', default=30)
+    parser.add_argument('--repeat', '-r', type=int, help='number of runs of each benchmark, the fastest being kept', default=1)
+    parser.add_argument('--output', '-o', type=str, help='json file to write results in', default='states/benchmark.json')
+    parser.add_argument('--compare', type=str, help='json file of a previous run to compare results with', default=None)
+    parser.add_argument('--seed', type=int, help='seed of the random choices', default=0)
+    return parser.parse_args()
+
+
+def raw_config_of(source: str) -> dict:
+    "Return the raw configuration to benchmark for given json configuration or ASP file"
+    if source.endswith('.lp'):  # generic configuration, as described in data/asp/one-to-one-assoc.lp
+        return {'base encoding file': source, 'choices options': {'type': 'at least 1'}}
+    with open(source) as fd:
+        return json.load(fd)
+
+
+def scaled_config(raw_config: dict, nb_users: int, *, max_models: int, time_limit: int) -> dict:
+    "Return a copy of given raw configuration, with nb_users users and as many choices"
+    raw_config = copy.deepcopy(raw_config)
+    raw_config['users options'] = {**raw_config.get('users options', {}), 'type': 'restricted', 'allowed': [f'user{idx}' for idx in range(nb_users)]}
+    chops = raw_config.get('choices options', [])
+    for chop in ([chops] if isinstance(chops, dict) else chops):
+        if chop.get('type') not in {'multiple users', 'single user'}:
+            chop['choices'] = [f'choice{idx}' for idx in range(nb_users)]
+    raw_config.setdefault('output options', {})['max models'] = max_models
+    raw_config.setdefault('solver options', {}).update({'time limit': time_limit, 'cache': False})
+    return raw_config
+
+
+def random_user_choices(cfg: dict, nb_choices: int, rng: random.Random) -> dict:
+    "Return user choices where each user chose its own choice and nb_choices random ones"
+    users = list(cfg['users options']['allowed'].values())
+    user_choices = {}
+    for idx, user in enumerate(users):
+        user_choices[user] = []
+        for chop in cfg['choices options']:
+            choices = list(chop['choices'].values())
+            if choices:
+                chosen = {choices[idx % len(choices)], *rng.sample(choices, min(nb_choices, len(choices)))}
+                user_choices[user].append(sorted(chosen))
+    return user_choices
+
+
+def run_phases(raw_config: dict, source: str, nb_choices: int, seed: int) -> dict:
+    "Return the runtime of each phase, and some measures of the benchmarked compilation"
+    hashname.clear_caches()  # so that repeated runs do not measure names computed by the previous ones
+    times = {}
+    def timed(phase: str, func: callable):
+        starttime = time.perf_counter()
+        result = func()
+        times[phase] = time.perf_counter() - starttime
+        return result
+
+    cfg, errors = timed('parsing', lambda: config.parse_configuration(copy.deepcopy(raw_config), filesource='benchmark-' + os.path.basename(source)))
+    if cfg is None:
+        raise ValueError('; '.join(map(str, errors)))
+    user_choices = random_user_choices(cfg, nb_choices, random.Random(seed))
+    encoding = timed('encoding', lambda: asp.compute_encoding(cfg, user_choices))
+    infos = {}
+    found = timed('solving', lambda: list(asp.solve_encoding(cfg, user_choices, infos=infos, encoding=encoding)))
+    backend = Backend('benchmark', '', cfg, raw_config, render_template_func=lambda *args, **kwargs: None)
+    symbols = SymbolTable()
+    models = timed('models', lambda: [backend.create_asp_model(idx, model, symbols) for idx, model in enumerate(found, start=1)])
+    def render():
+        stats = {'models': models, 'nb_models': len(models), 'compilation_runtime': 0., 'compilation_runtime_repr': '0s',
+                 'solving_interrupted': infos.get('interrupted', False), 'optimality_proven': infos.get('optimality proven'), 'solver_statistics': {}}
+        backend.render_header_and_footer(stats)
+        return [model.html_repr() for model in models]
+    timed('rendering', render)
+    return {
+        'times': times,
+        'encoding size': len(encoding),
+        'models': len(models),
+        'interrupted': infos.get('interrupted', False),
+        'solver statistics': infos.get('statistics', {}),
+    }
+
+
+def run_benchmarks(sources: [str], scales: [int], *, nb_choices: int, max_models: int, time_limit: int, repeat: int, seed: int) -> [dict]:
+    "Yield the result of each benchmark, keeping for each phase the fastest of the repeated runs"
+    for source in sources:
+        try:
+            raw_config = raw_config_of(source)
+        except (OSError, ValueError) as err:
+            print(f"WARNING: {source} skipped: {err}")
+            continue
+        for nb_users in scales:
+            result = {'source': source, 'users': nb_users}
+            scaled = scaled_config(raw_config, nb_users, max_models=max_models, time_limit=time_limit)
+            try:
+                runs = [run_phases(scaled, source, nb_choices, seed) for _ in range(repeat)]
+            except Exception as err:  # some examples are expected to fail, e.g. bad-config.json
+                result['error'] = f'{type(err).__name__}: {err}'
+            else:
+                result.update(runs[0])
+                result['times'] = {phase: min(run['times'][phase] for run in runs) for phase in PHASES}
+            print(format_result(result))
+            yield result
+
+
+def format_result(result: dict, previous: dict = None) -> str:
+    "Return a one-line human readable representation of given benchmark result, compared to previous one if given"
+    head = f"{result['source']} with {result['users']} users:"
+    if 'error' in result:
+        return f"{head} {result['error']}"
+    def phase_repr(phase: str) -> str:
+        runtime = result['times'][phase]
+        if previous and 'times' in previous and previous['times'].get(phase):
+            return f"{phase} {runtime:.3f}s (x{runtime / previous['times'][phase]:.2f})"
+        return f"{phase} {runtime:.3f}s"
+    return f"{head} " + ', '.join(map(phase_repr, PHASES)) + f" [{result['models']} models, {result['encoding size']} chars of encoding]"
+
+
+def compare(results: [dict], previous_results: [dict]):
+    "Print given results with the ratio of their runtimes to those of previous results"
+    previous = {(r['source'], r['users']): r for r in previous_results}
+    for result in results:
+        print(format_result(result, previous.get((result['source'], result['users']))))
+
+
+if __name__ == '__main__':
+    args = parse_cli()
+    sources = args.sources or sorted(glob.glob('examples/*.json')) + sorted(glob.glob('data/asp/*.lp'))
+    results = list(run_benchmarks(sources, args.scales, nb_choices=args.choices_per_user, max_models=args.max_models,
+                                  time_limit=args.time_limit, repeat=args.repeat, seed=args.seed))
+    with open(args.output, 'w') as fd:
+        json.dump({'python': platform.python_version(), 'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': results}, fd, indent=1)
+    print(f"Results written in {args.output}")
+    if args.compare:
+        with open(args.compare) as fd:
+            previous_results = json.load(fd)['results']
+        print(f"\nCompared to {args.compare}:")
+        compare(results, previous_results)
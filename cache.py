@@ -0,0 +1,139 @@
+"""Implementation of the caches used to avoid recomputing things, like models of an already solved encoding.
+
+"""
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Mapping from keys to values, forgetting the least recently used values
+    when more than maxsize are stored.
+
+    If a directory is given, values are also stored as json files in it,
+    and retrieved from it when not in memory anymore. The least recently used files
+    are removed when their total size exceeds disksize bytes.
+    If a weigh function is given, maxsize bounds the sum of the weights of the values
+    instead of their number, e.g. their total length with weigh=len.
+
+    >>> cache = LRUCache(maxsize=2)
+    >>> cache.set('a', 1); cache.set('b', 2); cache.get('a')
+    1
+    >>> cache.set('c', 3); 'b' in cache, 'a' in cache
+    (False, True)
+    >>> cache.get('b', 'missing'), cache.hits, cache.misses
+    ('missing', 1, 1)
+    >>> cache = LRUCache(maxsize=5, weigh=len)
+    >>> cache.set('a', 'abc'); cache.set('b', 'de'); cache.set('c', 'f'); 'a' in cache, len(cache), cache.weight
+    (False, 2, 3)
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as directory:
+    ...     cache = LRUCache(maxsize=1, directory=directory, disksize=8)
+    ...     cache.set('a', 'abc'); cache.set('b', 'de'); cache.get('a'), cache.get('b'), sorted(os.listdir(directory))
+    (None, 'de', ['b.json'])
+
+    """
+
+    def __init__(self, maxsize: int = 128, directory: str = None, *, disksize: int = 0, dump: callable = lambda v: v, load: callable = lambda v: v, weigh: callable = None):
+        self.maxsize, self.directory, self.disksize = maxsize, directory, disksize
+        self.dump, self.load = dump, load  # value <-> json-serializable value
+        self.weigh = (lambda v: 1) if weigh is None else weigh
+        self.hits, self.misses, self.weight = 0, 0, 0
+        self.__values = OrderedDict()
+        self.__lock = threading.Lock()  # caches are shared by compilations running in different threads
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__values
+
+    def __len__(self) -> int:
+        return len(self.__values)
+
+    def get(self, key: str, default: object = None, *, disk: bool = True) -> object:
+        with self.__lock:
+            if key in self.__values:
+                self.__values.move_to_end(key)
+                self.hits += 1
+                return self.__values[key]
+        if disk and self.directory and os.path.exists(path := self.path_of(key)):
+            try:
+                with open(path) as fd:
+                    value = self.load(json.load(fd))
+                os.utime(path)  # file modification time is its last use, see prune
+            except Exception as err:
+                print(f"WARNING: cache file {path} couldn't be loaded: {err}")
+            else:
+                self.hits += 1
+                self.set(key, value, disk=False)
+                return value
+        with self.__lock:
+            self.misses += 1
+        return default
+
+    def set(self, key: str, value: object, *, disk: bool = True):
+        with self.__lock:
+            if key in self.__values:
+                self.weight -= self.weigh(self.__values[key])
+            self.__values[key] = value
+            self.__values.move_to_end(key)
+            self.weight += self.weigh(value)
+            while self.maxsize and self.weight > self.maxsize and self.__values:
+                self.weight -= self.weigh(self.__values.popitem(last=False)[1])
+        if disk and self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.path_of(key), 'w') as fd:
+                json.dump(self.dump(value), fd)
+            self.prune()
+
+    def prune(self):
+        "Remove the least recently used files of the directory, until their total size is at most disksize"
+        if not self.disksize:
+            return
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                except OSError:  # removed meanwhile by another thread
+                    continue
+                files.append((stat.st_mtime, entry.path, stat.st_size))
+        total = sum(size for _, _, size in files)
+        for _, path, size in sorted(files):
+            if total <= self.disksize:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        with self.__lock:
+            self.__values.clear()
+            self.weight = 0
+
+    def path_of(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.json')
+
+
+def key_of(*objects) -> str:
+    """Return a hash of given json-serializable objects, usable as a cache key
+
+    >>> key_of('a', {'n': 1}) == key_of('a', {'n': 1}), key_of('a') == key_of('b')
+    (True, False)
+
+    """
+    return hashlib.blake2b(json.dumps(objects, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+
+def as_tuples(obj: object) -> object:
+    """Return given json-loaded object with lists converted back to tuples
+
+    >>> as_tuples([['a', [1, ['', [2, 3]]]]])
+    (('a', (1, ('', (2, 3)))),)
+
+    """
+    if isinstance(obj, list):
+        return tuple(map(as_tuples, obj))
+    return obj
@@ -43,6 +43,7 @@ def parse_configuration(data:dict, *, filesource: str, verify_and_normalize: boo
     set_default('global options', 'base encoding file', None)
     set_default('global options', 'shows', '')
     set_default('global options', 'compilation', 'direct access')
+    set_default('global options', 'auto compilation delay', 0)
     set_default('global options', 'generated pages', 'all')
     set_default('global options', 'public pages', None)
     set_default('global options', 'raise warnings', True)
@@ -52,12 +53,18 @@ def parse_configuration(data:dict, *, filesource: str, verify_and_normalize: boo
     set_default('users options', 'allowed', {})
     set_default('users options', 'description', "Please indicate your username:")
     set_default('output options', 'max models', 0)
+    set_default('output options', 'models per page', 100)
     set_default('output options', 'model selection', 'first')
+    set_default('output options', 'sampling pool', 'auto')
     set_default('output options', 'model header repr', 'standard')
     set_default('output options', 'model repr', [])
     set_default('output options', 'model footer repr', 'standard')
     set_default('output options', 'insatisfiability message', "<i>That program is unsatisfiable.</i>")
+    set_default('output options', 'interruption message', "<i>Solving was stopped by its time or model limit: shown models may not be all of them, and are not proven optimal.</i>")
     set_default('output options', 'show human-readable id', True)
+    set_default('output options', 'sort models', False)
+    set_default('output options', 'streaming', False)
+    set_default('output options', 'parallel rendering', False)
     set_default('output options', 'plugin repr', [])
     set_default('output options', 'header repr', 'standard')
     set_default('output options', 'footer repr', 'standard')
@@ -72,6 +79,14 @@ def parse_configuration(data:dict, *, filesource: str, verify_and_normalize: boo
     set_default('solver options', 'path', 'clingo')
     set_default('solver options', 'constants', {})
     set_default('solver options', 'solving mode', 'default')
+    set_default('solver options', 'cache', True)
+    set_default('solver options', 'disk cache', False)
+    set_default('solver options', 'incremental', False)
+    set_default('solver options', 'time limit', 0)
+    set_default('solver options', 'model limit', 0)
+    set_default('solver options', 'parallel', 'none')
+    set_default('solver options', 'threads', 0)
+    set_default('solver options', 'compact encoding', True)
     set_default('meta', 'filesource', filesource)
     set_default('meta', 'save state', True)
 
@@ -114,6 +129,9 @@ def parse_configuration(data:dict, *, filesource: str, verify_and_normalize: boo
     if data["global options"]["public pages"] is None:
         data["global options"]["public pages"] = data["global options"]["generated pages"]
 
+    if data["output options"]["sampling pool"] == 'auto':
+        data["output options"]["sampling pool"] = 10 * data["output options"]["max models"]
+
     for chop in data["choices options"]:
         if chop["default"] == 'all':
             chop["default"] = list(chop["choices"].values())
@@ -225,9 +243,10 @@ def errors_in_configuration(cfg: dict):
             errors.append(f"{key} '{subkey}' is invalid: '{val}'. Accepted values are {', '.join(map(repr, set(ok_values)|set(other_valid_values)))}")
 
     ensure_in("users options", "type", {'restricted', 'valid-id', 'convertible'})
-    ensure_in("global options", "compilation", {'direct access', 'specific access'})
-    ensure_in("solver options", "engine", {'ASP/clingo'})
+    ensure_in("global options", "compilation", {'direct access', 'background access', 'specific access'})
+    ensure_in("solver options", "engine", {'ASP/clingo', 'ASP/clingo module'})
     ensure_in("solver options", "solving mode", {'optimals', 'default'})
+    ensure_in("solver options", "parallel", {'none', 'compete', 'split', 'portfolio'})
 
     def rec_ensure_in(key, subkey, ok_values, other_valid_values=set()):
         for sub in cfg[key]:
@@ -247,12 +266,25 @@ def errors_in_configuration(cfg: dict):
             errors.append(f"{key} '{subkey}' is of invalid type: value {repr(val)} of type {type(val)}. Accepted types are {', '.join(map(repr, types))}")
 
     ensure_is('solver options', 'cli', list)
+    ensure_is('global options', 'auto compilation delay', int, float)
     ensure_is("meta", "save state", bool)
     ensure_is("output options", "show human-readable id", bool)
+    ensure_is("output options", "sort models", bool)
+    ensure_is("output options", "models per page", int)
+    ensure_is("output options", "sampling pool", int)
+    ensure_is("output options", "streaming", bool)
+    ensure_is("output options", "parallel rendering", bool)
     ensure_is("output options", "model repr", list)
     ensure_is("output options", "header repr", list)
     ensure_is("output options", "footer repr", list)
     ensure_is('solver options', 'constants', dict)
+    ensure_is('solver options', 'cache', bool)
+    ensure_is('solver options', 'disk cache', bool)
+    ensure_is('solver options', 'incremental', bool)
+    ensure_is('solver options', 'time limit', int)
+    ensure_is('solver options', 'model limit', int)
+    ensure_is('solver options', 'threads', int)
+    ensure_is('solver options', 'compact encoding', bool)
 
     def rec_ensure_is(key, subkey, *types):
         for idx, sub in enumerate(cfg[key], start=1):
@@ -285,6 +317,19 @@ def errors_in_configuration(cfg: dict):
     ensure_file('thanks.html')
 
 
+    if cfg['output options']['streaming'] and cfg['global options']['compilation'] != 'direct access':
+        errors.append(f"Output option 'streaming' needs the 'direct access' compilation, not {repr(cfg['global options']['compilation'])}")
+    if cfg['output options']['streaming'] and cfg['output options']['sort models']:
+        errors.append("Output options 'streaming' and 'sort models' can't be used together, since sorting needs all the models")
+
+
+    # check availability of the solver
+    if cfg['solver options']['engine'] == 'ASP/clingo module' and utils.clingo is None:
+        errors.append("Solver engine 'ASP/clingo module' needs the clingo python module, which couldn't be imported")
+    if cfg['solver options']['incremental'] and cfg['solver options']['engine'] != 'ASP/clingo module':
+        errors.append(f"Solver option 'incremental' needs the 'ASP/clingo module' engine, not {repr(cfg['solver options']['engine'])}")
+
+
     # check existence of encoding file, if any
     if cfg['global options']['base encoding file']:
         try:
@@ -0,0 +1,198 @@
+"""Load testing of bakasp As A Service.
+
+Instances are created from local configurations through /create/byconfig,
+then users submit choices and read results, according to the given mix of requests,
+by as many concurrent clients as asked. The app is driven through the flask
+test client, or through HTTP when an url is given (e.g. of a local gunicorn).
+Latency percentiles of each route are reported at the end.
+
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import random
+import argparse
+import threading
+import contextlib
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import config as config_module
+import aas_config as aasconfig_module
+
+
+ROUTES = ('choice', 'results', 'users')
+
+
+def parse_cli() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('configurations', nargs='*', type=str, help='json configurations of the instances to create', default=['examples/choose-your-character.json'])
+    parser.add_argument('--url', type=str, help='url of a running aas server, e.g. http://localhost:8000. The app is run in-process if not given', default=None)
+    parser.add_argument('--aas-config', type=str, help='aas configuration used for the in-process app, which neither loads nor saves its state', default='examples/empty.json')
+    parser.add_argument('--instances', '-i', type=int, help='number of instances created from each configuration', default=2)
+    parser.add_argument('--requests', '-n', type=int, help='number of requests made once instances are created', default=500)
+    parser.add_argument('--concurrency', '-c', type=int, help='number of concurrent clients', default=8)
+    parser.add_argument('--mix', '-m', nargs='+', type=str, help=f'weights of routes, among {", ".join(ROUTES)}', default=['choice=4', 'results=1', 'users=1'])
+    parser.add_argument('--output', '-o', type=str, help='json file to write latencies percentiles in', default=None)
+    parser.add_argument('--verbose', '-v', action='store_true', help="don't hide the output of the in-process app")
+    parser.add_argument('--seed', type=int, help='seed of the random requests', default=0)
+    return parser.parse_args()
+
+
+def parse_mix(mix: [str]) -> dict:
+    """Return route -> weight from given route=weight strings
+
+    >>> parse_mix(['choice=4', 'results'])
+    {'choice': 4.0, 'results': 1.0}
+
+    """
+    weights = {}
+    for item in mix:
+        route, _, weight = item.partition('=')
+        if route not in ROUTES:
+            raise ValueError(f"Unknown route {route}. Available routes: {', '.join(ROUTES)}")
+        weights[route] = float(weight or 1)
+    return weights
+
+
+def percentile(values: [float], rank: float) -> float:
+    """Return the given percentile of given sorted values, using the nearest rank method
+
+    >>> values = list(range(1, 101))
+    >>> percentile(values, 50), percentile(values, 99), percentile(values, 100)
+    (50, 99, 100)
+
+    """
+    return values[max(0, min(len(values) - 1, int(round(rank / 100 * len(values))) - 1))]
+
+
+class FlaskClientTarget:
+    "Send requests to the app in-process, with one flask test client per thread"
+
+    def __init__(self, app):
+        self.app, self.local = app, threading.local()
+
+    def request(self, method: str, path: str, data: dict = None) -> (int, str):
+        "Return status code and redirection location of the response"
+        if not hasattr(self.local, 'client'):
+            self.local.client = self.app.test_client()
+        response = self.local.client.open(path, method=method, data=data)
+        response.close()  # consume the body, including streamed ones
+        return response.status_code, response.headers.get('Location')
+
+
+class HTTPTarget:
+    "Send requests to a running server through HTTP"
+
+    class NoRedirection(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None  # redirections are given back to the caller
+
+    def __init__(self, url: str):
+        self.url = url.rstrip('/')
+        self.opener = urllib.request.build_opener(self.NoRedirection)
+
+    def request(self, method: str, path: str, data: dict = None) -> (int, str):
+        "Return status code and redirection location of the response"
+        body = urllib.parse.urlencode(data, doseq=True).encode() if data is not None else None
+        try:
+            with self.opener.open(urllib.request.Request(self.url + path, data=body, method=method)) as response:
+                response.read()
+                return response.status, response.headers.get('Location')
+        except urllib.error.HTTPError as err:
+            return err.code, err.headers.get('Location')
+
+
+class LoadTest:
+    "Create instances on given target, then run requests on them, keeping latencies of each route"
+
+    def __init__(self, target: object, configurations: [str], nb_instances: int, *, seed: int = 0):
+        self.target, self.rng = target, random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.latencies = defaultdict(list)  # route -> latencies
+        self.errors = defaultdict(int)  # route -> number of unexpected status codes
+        self.instances = []  # (root of the instance, admin code, userids, configuration)
+        for path in configurations:
+            with open(path) as fd:
+                raw_config = json.load(fd)
+            cfg, errors = config_module.parse_configuration(copy.deepcopy(raw_config), filesource=path)
+            if cfg is None:
+                raise ValueError(f"Configuration {path} is invalid: {errors}")
+            for _ in range(nb_instances):
+                self.instances.append(self.create_instance(raw_config, cfg))
+
+    def timed(self, route: str, method: str, path: str, data: dict = None, expected: set = {200}) -> (int, str):
+        starttime = time.perf_counter()
+        status, location = self.target.request(method, path, data)
+        self.latencies[route].append(time.perf_counter() - starttime)
+        if status not in expected:
+            self.errors[route] += 1
+        return status, location
+
+    def create_instance(self, raw_config: dict, cfg: dict) -> tuple:
+        period = next(iter(aasconfig_module.TIMES))
+        _, location = self.timed('create', 'POST', '/create/byconfig', {'Config': json.dumps(raw_config), 'period': period}, expected={302})
+        # location is like [http://host]/b/<uid>/admin/<admin code>
+        root, _, admin = urllib.parse.urlparse(location).path.partition('/admin/')
+        return root, admin, list(cfg['users options']['allowed'].values()), cfg
+
+    def random_request(self, weights: dict):
+        with self.rng_lock:  # random.Random is not meant to be shared among threads
+            route = self.rng.choices(tuple(weights), weights=tuple(weights.values()))[0]
+            root, admin, userids, cfg = self.rng.choice(self.instances)
+            userid = self.rng.choice(userids)
+            chop = cfg['choices options'][0] if cfg['choices options'] else {'choices': {}}
+            choices = self.rng.sample(list(chop['choices'].values()), min(2, len(chop['choices'])))
+        if route == 'choice':
+            self.timed(route, 'POST', f'{root}/user/{userid}/0', {'choice': choices}, expected={302})
+        elif route == 'results':
+            self.timed(route, 'GET', f'{root}/results/admin/{admin}')
+        elif route == 'users':
+            self.timed(route, 'GET', f'{root}/user')
+
+    def run(self, nb_requests: int, concurrency: int, weights: dict) -> float:
+        "Run given number of requests, return the total runtime"
+        starttime = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for future in [executor.submit(self.random_request, weights) for _ in range(nb_requests)]:
+                future.result()
+        return time.perf_counter() - starttime
+
+    def report(self) -> dict:
+        "Return route -> latency stats, in milliseconds"
+        report = {}
+        for route, latencies in self.latencies.items():
+            latencies = sorted(latencies)
+            report[route] = {
+                'requests': len(latencies),
+                'errors': self.errors[route],
+                **{f'p{rank}': round(percentile(latencies, rank) * 1000, 2) for rank in (50, 90, 99)},
+                'max': round(latencies[-1] * 1000, 2),
+            }
+        return report
+
+
+if __name__ == '__main__':
+    args = parse_cli()
+    weights = parse_mix(args.mix)
+    with contextlib.redirect_stdout(sys.stdout if args.verbose or args.url else open(os.devnull, 'w')):
+        if args.url:
+            target = HTTPTarget(args.url)
+        else:
+            from aas import create_aas_app
+            target = FlaskClientTarget(create_aas_app(args.aas_config, meta={'load state': False, 'save state': False}))
+        loadtest = LoadTest(target, args.configurations, args.instances, seed=args.seed)
+        runtime = loadtest.run(args.requests, args.concurrency, weights)
+    report = loadtest.report()
+    print(f"{args.requests} requests in {runtime:.2f}s ({args.requests / runtime:.1f} requests/s) with {args.concurrency} clients")
+    for route, stats in report.items():
+        print(f"{route:>8}: {stats['requests']} requests, {stats['errors']} errors, " + ', '.join(f'{name} {value}ms' for name, value in stats.items() if name.startswith('p') or name == 'max'))
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump({'runtime': runtime, 'concurrency': args.concurrency, 'mix': weights, 'routes': report}, fd, indent=1)
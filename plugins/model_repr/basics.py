@@ -14,7 +14,7 @@ class text(ModelReprPlugin):
         "text": '',
     }
 
-    def render_text(self, uid=None, models=None, model=None, nb_models=None, compilation_runtime_repr=None, compilation_runtime=None, common_atoms=None):
+    def render_text(self, uid=None, models=None, model=None, nb_models=None, compilation_runtime_repr=None, compilation_runtime=None, common_atoms=None, solving_interrupted=None, optimality_proven=None, solver_statistics=None):
         ns = dict(locals())
         exec('ret = f' + repr(self.options.text), ns)
         return ns['ret']
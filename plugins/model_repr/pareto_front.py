@@ -2,26 +2,72 @@
 from model_repr import ModelReprPlugin
 
 import io
+import bisect
 import plotly
 from plotly import express
 
 
 def pareto_of(scored_models):
-    all_scores = set(s for s, m in scored_models)
+    """Yield the given (score, model) whose score is not dominated by another one,
+    i.e. no other score is greater or equal on all metrics, and greater on one
 
-    def is_worse(sa, sb):
-        "True if sa is worse than sb"
-        return all(a <= b for a, b in zip(sa, sb)) and any(a < b for a, b in zip(sa, sb))
+    >>> list(pareto_of([((1, 3), 'a'), ((2, 2), 'b'), ((1, 1), 'c'), ((2, 2), 'd'), ((0, 4), 'e')]))
+    [((1, 3), 'a'), ((2, 2), 'b'), ((2, 2), 'd'), ((0, 4), 'e')]
+    >>> list(pareto_of([((1, 1, 3), 'a'), ((1, 1, 2), 'b'), ((3, 0, 0), 'c'), ((0, 2, 2), 'd'), ((1, 2, 2), 'e')]))
+    [((1, 1, 3), 'a'), ((3, 0, 0), 'c'), ((1, 2, 2), 'e')]
 
-    unwanted = set()
-    for score in all_scores:
-        if any(is_worse(score, other) for other in all_scores):
-            unwanted.add(score)
-
-    accepted = all_scores - unwanted
+    """
+    accepted = skyline(set(s for s, m in scored_models))
     yield from ((s, m) for s, m in scored_models if s in accepted)
 
 
+def skyline(scores: set) -> set:
+    """Return the given scores that are not dominated by another one.
+
+    Scores are swept by decreasing lexicographic order, so that a score
+    can only be dominated by one already seen. In 2D, it is dominated
+    if one of them has a greater or equal y. In 3D, the non-dominated (y, z)
+    seen so far are kept as a staircase, where z decreases when y increases,
+    and the one to check is the first with a greater or equal y.
+    Other dimensions are handled by comparison to the front built so far.
+
+    >>> sorted(skyline({(1, 3), (2, 2), (1, 1), (3, 2), (0, 4)}))
+    [(0, 4), (1, 3), (3, 2)]
+    >>> sorted(skyline({(2, 1, 1), (1, 2, 1), (1, 1, 2), (1, 1, 1), (2, 2, 0), (2, 0, 2)}))
+    [(1, 1, 2), (1, 2, 1), (2, 0, 2), (2, 1, 1), (2, 2, 0)]
+    >>> sorted(skyline({(1, 1, 1, 2), (1, 1, 1, 1), (0, 2, 0, 0)}))
+    [(0, 2, 0, 0), (1, 1, 1, 2)]
+
+    """
+    ordered = sorted(scores, reverse=True)
+    dims = len(ordered[0]) if ordered else 0
+    front = set()
+    if dims <= 1:
+        front.update(ordered[:1])
+    elif dims == 2:
+        best_y = None
+        for score in ordered:
+            if best_y is None or score[1] > best_y:
+                front.add(score)
+                best_y = score[1]
+    elif dims == 3:
+        ys, neg_zs = [], []  # staircase of the (y, z) seen so far: y increasing, z decreasing
+        for score in ordered:
+            _, y, z = score
+            idx = bisect.bisect_left(ys, y)
+            if idx < len(ys) and -neg_zs[idx] >= z:
+                continue  # dominated
+            front.add(score)
+            # remove the steps dominated by (y, z), i.e. with lower y and lower z
+            first, last = bisect.bisect_left(neg_zs, -z), bisect.bisect_right(ys, y)
+            ys[first:last], neg_zs[first:last] = [y], [-z]
+    else:
+        for score in ordered:
+            if not any(all(a >= b for a, b in zip(other, score)) for other in front):
+                front.add(score)
+    return front
+
+
 class ParetoFront(ModelReprPlugin):
     """Generate and embed a plotly scatter plot.
 
@@ -40,9 +86,13 @@ class ParetoFront(ModelReprPlugin):
         "include_plotlyjs": 'cdn',
     }
 
+    METRICS = ('x', 'y')
+    PURE = False  # optimal models are computed when rendering header or footer
+
     def init(self):
         self.all_scored_models = []
         self.optimal_models = None
+        self.optimal_uids = frozenset()
 
     def plot_scatter_html(self):
         if not self.optimal_models:
@@ -63,26 +113,31 @@ class ParetoFront(ModelReprPlugin):
             return out.getvalue() + f'<br/><center>{title}</center><br/>'
 
     def get_model_score(self, model: object):
-        return (
-            int(next((args[0] for pred, args in model.atoms if pred == self.options.x and len(args)==1), 0)),
-            int(next((args[0] for pred, args in model.atoms if pred == self.options.y and len(args)==1), 0))
-        )
-
-    def on_footer(self, models: tuple, **kwargs):
+        "Return the value of each metric in given model, i.e. the argument of the first atom metric/1, or 0"
+        score = []
+        for metric in self.METRICS:
+            argss = model.args_of(getattr(self.options, metric), 1)
+            score.append(int(argss[0][0]) if argss else 0)
+        return tuple(score)
+
+    def compute_optimal_models(self, models: tuple):
         if self.optimal_models is None:
             self.optimal_models = dict(pareto_of([(self.get_model_score(model), model) for model in models]))
+            self.optimal_uids = frozenset(m.uid for m in self.optimal_models.values())
+
+    def on_footer(self, models: tuple, **kwargs):
+        self.compute_optimal_models(models)
         if self.options.place.lower() == 'footer':
             return self.plot_scatter_html()
 
     def on_header(self, models: tuple, **kwargs):
-        if self.optimal_models is None:
-            self.optimal_models = dict(pareto_of([(self.get_model_score(model), model) for model in models]))
+        self.compute_optimal_models(models)
         if self.options.place.lower() == 'header':
             return self.plot_scatter_html()
 
     def on_model(self, idx: int, uid: str, model: object):
         "We expect that function to be called after creation of footer and headers"
-        if uid in (m.uid for m in self.optimal_models.values()):
+        if uid in self.optimal_uids:
             return self.options.model_optimality_flag or ''
 
 
@@ -103,6 +158,7 @@ class ParetoFront3D(ParetoFront):
         "model optimality flag": "<u>OPTIMAL</u><br/><br/>",
         "include_plotlyjs": True,
     }
+    METRICS = ('x', 'y', 'z')
 
     def plot_scatter_html(self):
         x, y, z, uid = zip(*([*s, m.uid] for s, m in self.optimal_models.items()))
@@ -118,10 +174,3 @@ class ParetoFront3D(ParetoFront):
         with io.StringIO() as out:
             p.write_html(out, auto_open=False, include_plotlyjs=self.options.include_plotlyjs, full_html=False)
             return out.getvalue()
-
-    def get_model_score(self, model: object):
-        return (
-            int(next((args[0] for pred, args in model.atoms if pred == self.options.x and len(args)==1), 0)),
-            int(next((args[0] for pred, args in model.atoms if pred == self.options.y and len(args)==1), 0)),
-            int(next((args[0] for pred, args in model.atoms if pred == self.options.z and len(args)==1), 0))
-        )
@@ -21,11 +21,8 @@ class raw(ModelReprPlugin):
         else:
             raise NotImplementedError("Sorry.")
 
-        by_pred = {}
-        for atom, args in model.atoms:
-            by_pred.setdefault(atom, []).append(args)
         html = []
-        for atom, argss in by_pred.items():
+        for (atom, _), argss in model.index().items():
             if not ok(atom): continue
             yield f'{len(argss)} <code>{atom}</code> atoms found: <code>' + ' '.join(f'{atom}({",".join(map(str, args))}).' for args in argss if oka(atom, args)) + '</code><br/>'
         yield self.options.footer
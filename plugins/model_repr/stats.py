@@ -1,5 +1,5 @@
 from model_repr import ModelReprPlugin
-from collections import Counter
+from asp_model import ModelsAggregate
 
 import io
 import plotly
@@ -32,22 +32,19 @@ class stats(ModelReprPlugin):
 
 
     def compute_union_intersection_and_counts(self, models):
-        models = iter(models)
-        first = next(models)
-        union, intersection = set(first.atoms), set(first.atoms)
-        for model in models:
-            union |= set(model.atoms)
-            intersection &= set(model.atoms)
-        self.__union = frozenset(union)
-        self.__intersection = frozenset(intersection)
-        self.__counts = Counter(f'{pred}/{len(args)}' for pred, args in self.__union)
+        aggregate = ModelsAggregate(tuple(models))
+        self.__union = frozenset(aggregate.union())
+        self.__intersection = frozenset(aggregate.intersection())
+        self.__counts = aggregate.counts_by_predicate()
 
     def get_union(self, models):
         yield f"A total of {len(self.__union)} different atoms were generated."
     def get_intersection(self, models):
         yield f"All models have {len(self.__intersection)} atoms in common."
     def get_counts(self, models):
-        if self.options.plot_counts:
+        if not self.__counts:
+            yield "No atoms to count."
+        elif self.options.plot_counts:
             uid, cs = zip(*self.__counts.items())
             title = self.options.title
             p = express.bar(
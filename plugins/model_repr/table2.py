@@ -2,6 +2,8 @@
 
 from model_repr import ModelReprPlugin
 
+from collections import namedtuple
+
 
 class table2(ModelReprPlugin):
     OPTIONS = {
@@ -16,39 +18,61 @@ class table2(ModelReprPlugin):
         'pair link text': 'has',
     }
 
+    def init(self):
+        self.pattern = compile_source(self.options.source)
+
     def on_model(self, idx: int, uid: str, model: object):
         """Return html representation of given model"""
-
-        def att_to_label(att: object) -> str:
-            if self.options.columns == 'choice':
-                return self.get_choicename_of(att)
-            else:  # get the corresponding element of the columns list of items
-                return self.options.columns[atts.index(att) % len(self.options.columns)]
-
-        def obj_to_label(obj: object) -> str:
-            if self.options.rows == 'user':
-                return self.get_username_of(obj)
-            else:  # get the corresponding element of the rows list of items
-                return self.options.rows[objs.index(obj) % len(self.options.rows)]
-
-        objs, atts, rels = fields_from_source(model.atoms, self.options.source)
-        if self.options.enable_pair_repr_if_possible and all(len(assocs) == 1 for assocs in rels.values()) and sum(1 for _ in rels.values()) == sum(1 for _ in atts):
+        objs, atts, rels = fields_from_pattern(model.args_of(self.pattern.predicate, self.pattern.arity), self.pattern)
+
+        # labels of all columns and rows, computed once
+        if self.options.columns == 'choice':
+            att_labels = {att: self.get_choicename_of(att) for att in atts}
+        else:  # get the corresponding element of the columns list of items
+            att_labels = {att: self.options.columns[idx % len(self.options.columns)] for idx, att in enumerate(atts)}
+        if self.options.rows == 'user':
+            obj_labels = {obj: self.get_username_of(obj) for obj in objs}
+        else:  # get the corresponding element of the rows list of items
+            obj_labels = {obj: self.options.rows[idx % len(self.options.rows)] for idx, obj in enumerate(objs)}
+
+        if self.options.enable_pair_repr_if_possible and all(len(assocs) == 1 for assocs in rels.values()) and len(rels) == len(atts):
             # it's a one-to-one relationship between objs and atts
             # let's show them in a readable manner
             html = []
             for obj in objs:
                 att = next(iter(rels[obj]))
-                html.append(f"<li>{obj_to_label(obj)} {self.options.pair_link_text} {att_to_label(att)}</li>")
+                html.append(f"<li>{obj_labels[obj]} {self.options.pair_link_text} {att_labels[att]}</li>")
             html = '<div style="display: inline-block"><ul style="text-align: left; list-style-type:none">' + ''.join(html) + '</ul></div>'
         else:  # it's not just a one-to-one association
-            html = [' <tr>\n  <td></td>\n' + ''.join(f'   <th>{att_to_label(att)}</th>\n' for att in atts) + ' </tr>\n']
+            html = [' <tr>\n  <td></td>\n' + ''.join(f'   <th>{att_labels[att]}</th>\n' for att in atts) + ' </tr>\n']
             for obj in objs:
-                html.append(f' <tr>\n  <td>{obj_to_label(obj)}</td>' + ''.join(f'   <td>{"×" if att in rels[obj] else ""}</td>\n' for att in atts) + ' </tr>\n')
+                html.append(f' <tr>\n  <td>{obj_labels[obj]}</td>' + ''.join('   <td>×</td>\n' if att in rels[obj] else '   <td></td>\n' for att in atts) + ' </tr>\n')
             caption = self.options.caption_style.format(caption=self.options.caption) if self.options.caption else ''
             html = '<table>' + ''.join(html) + '</table>' + caption
         return html
 
 
+SourcePattern = namedtuple('SourcePattern', 'predicate, arity, rows, columns, constants')
+
+
+def compile_source(source: str) -> SourcePattern:
+    """Return the pattern described by given source, i.e. the predicate and arity of the atoms to consider,
+    the positions of rows and columns in their args, and the (position, value) that they must have.
+
+    >>> compile_source("assoc/columns,_,rows,yes")
+    SourcePattern(predicate='assoc', arity=4, rows=2, columns=0, constants=((3, 'yes'),))
+
+    """
+    assert '/' in source, f"source is not properly formatted: expects '{{pred}}/{{arg1}},…,{{argN}}', not {repr(source)}"
+    src_pred, src_args = source.split('/')
+    src_args = src_args.split(',')
+    # the last occurrence of rows and columns is the one used, as when building a dict of the args
+    positions = {field: pos for pos, field in enumerate(src_args)}
+    assert 'rows' in positions and 'columns' in positions, f"source arguments are not properly named: expects rows and columns, not {' and '.join(src_args)}."
+    constants = tuple((pos, field) for pos, field in enumerate(src_args) if field not in {'rows', 'columns', '_'})
+    return SourcePattern(src_pred, len(src_args), positions['rows'], positions['columns'], constants)
+
+
 def fields_from_source(atoms: iter, source: str) -> (list, list, dict):
     """
     Returns list of rows, list of columns, and relations between the two
@@ -73,20 +97,16 @@ def fields_from_source(atoms: iter, source: str) -> (list, list, dict):
     ([1], [2], {1: {2}})
 
     """
-    assert '/' in source, f"source is not properly formatted: expects '{{pred}}/{{arg1}},…,{{argN}}', not {repr(source)}"
-    src_pred, src_args = source.split('/')
-    src_args = src_args.split(',')
-    # assert set(src_args) == {'rows', 'columns', '_'}, f"source arguments are not properly named: expects rows and columns, not {' and '.join(src_args)}."
-    ret_rows, ret_columns, ret_relations = set(), set(), {}
-
-    for pred, args in atoms:
-        if pred == src_pred and len(args) == len(src_args):
-            for field, value in zip(src_args, args):
-                if field not in {'rows', 'columns', '_'} and field != str(value):
-                    break  # this atom must be filtered out
-            else:  # the atom corresponds to the source signature
-                dargs = dict(zip(src_args, args))
-                ret_rows.add(dargs['rows'])
-                ret_columns.add(dargs['columns'])
-                ret_relations.setdefault(dargs['rows'], set()).add(dargs['columns'])
-    return sorted(list(ret_rows)), sorted(list(ret_columns)), ret_relations
+    pattern = compile_source(source)
+    return fields_from_pattern((args for pred, args in atoms if pred == pattern.predicate and len(args) == pattern.arity), pattern)
+
+
+def fields_from_pattern(argss: iter, pattern: SourcePattern) -> (list, list, dict):
+    "Return rows, columns and relations found in given args of atoms of the predicate and arity of given pattern"
+    rows, columns, constants = pattern.rows, pattern.columns, pattern.constants
+    ret_relations = {}
+    for args in argss:
+        if all(str(args[pos]) == value for pos, value in constants):
+            ret_relations.setdefault(args[rows], set()).add(args[columns])
+    ret_columns = set().union(*ret_relations.values())
+    return sorted(ret_relations), sorted(ret_columns), ret_relations
@@ -46,6 +46,9 @@ def with_keys_as_id(d: dict) -> dict:
 
 
 class ModelReprPlugin(Plugin):
+    # True if on_model only depends on its arguments and the options, so that models may be rendered
+    # concurrently and in any order. False if it depends on what was computed by on_header or on_footer.
+    PURE = True
 
     @staticmethod
     def get_plugins():
@@ -0,0 +1,105 @@
+"""Scheduling of the compilations of all instances running in the process.
+
+Compilations are run by a limited number of workers. Among instances waiting for
+their compilation, the next one to compile is chosen by weighted fair queuing:
+each compilation costs its weight to its instance, and the instance
+that would have consumed the least once served is served first.
+With the 'round robin' fairness, all compilations weight the same.
+
+"""
+import time
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import Future
+
+import utils
+
+
+Job = namedtuple('Job', 'future, func, start, finish, submitted')
+
+
+class CompilationScheduler:
+    """Run submitted functions in at most max_workers threads, fairly among keys.
+
+    A function submitted for a key that is already waiting to be run is not queued:
+    the future of the waiting one is returned instead.
+
+    >>> scheduler = CompilationScheduler(max_workers=1)
+    >>> scheduler.submit('a', lambda: 42).result()
+    42
+
+    """
+
+    def __init__(self, max_workers: int = 4, fairness: str = 'round robin'):
+        self.max_workers, self.fairness = max_workers, fairness
+        self.pending = {}  # key -> Job
+        self.finish = {}  # key -> virtual finish time of its last submitted job
+        self.clock = 0  # virtual time, i.e. virtual start time of the last dispatched job
+        self.running, self.done, self.coalesced = 0, 0, 0
+        self.waits = deque(maxlen=1000)  # waiting times of the last dispatched jobs
+        self.workers = []
+        self.condition = threading.Condition()
+
+    def submit(self, key: object, func: callable, weight: int = 1) -> Future:
+        with self.condition:
+            if key in self.pending:
+                self.coalesced += 1
+                return self.pending[key].future
+            weight = weight if self.fairness == 'weighted' else 1
+            start = max(self.clock, self.finish.get(key, 0))
+            self.finish[key] = start + weight
+            job = self.pending[key] = Job(Future(), func, start, start + weight, time.time())
+            if len(self.workers) < self.max_workers:
+                worker = threading.Thread(target=self.work, name=f'bakasp-compilation-{len(self.workers)}', daemon=True)
+                self.workers.append(worker)
+                worker.start()
+            self.condition.notify()
+            return job.future
+
+    def next_job(self) -> Job:
+        "Return the next job to run, removing it from pending ones. Must be called with the condition held"
+        key = min(self.pending, key=lambda k: (self.pending[k].finish, self.pending[k].submitted))
+        job = self.pending.pop(key)
+        self.clock = max(self.clock, job.start)
+        for key in tuple(self.finish):  # forget keys that are now late, so they start at the clock
+            if self.finish[key] <= self.clock and key not in self.pending:
+                del self.finish[key]
+        return job
+
+    def work(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                job = self.next_job()
+                self.running += 1
+                self.waits.append(time.time() - job.submitted)
+            if job.future.set_running_or_notify_cancel():
+                try:
+                    job.future.set_result(job.func())
+                except BaseException as err:
+                    job.future.set_exception(err)
+            with self.condition:
+                self.running -= 1
+                self.done += 1
+
+    def demand(self) -> int:
+        "Return the number of compilations running or queued"
+        with self.condition:
+            return self.running + len(self.pending)
+
+    def stats(self) -> dict:
+        with self.condition:
+            waits = tuple(self.waits)
+            return {
+                '#compilations queued': len(self.pending),
+                '#compilations running': self.running,
+                '#compilations done': self.done,
+                '#compilation requests coalesced': self.coalesced,
+                'mean compilation wait': utils.human_repr_of_runtime(sum(waits) / len(waits) if waits else 0.),
+                'max compilation wait': utils.human_repr_of_runtime(max(waits, default=0.)),
+            }
+
+
+# scheduler of all compilations of the process
+SCHEDULER = CompilationScheduler()
@@ -1,5 +1,6 @@
 
 import os
+import asp
 from flask import Flask
 from config import parse_configuration
 from bakasp import create_website
@@ -31,7 +32,7 @@ def test_basic_api():
         back.html_thank_you_page: ('thanks.html', 'username,root'),
         back.html_user_list_page: ('user.html', 'root,user_choice_text,elements'),
         back.html_history: ('history.html', 'root,history,no_history'),
-        back.html_results: ('results.html', 'root,models,header,message,footer'),
+        back.html_results: ('results.html', 'root,models,header,message,footer,recomputing,generation,pagination'),
     }
     FUNCTIONS_TO_JUST_CALL = (
         back.html_config,  # won't call the template renderer, since it returns json directly
@@ -48,3 +49,213 @@ def test_basic_api():
     set_this_to_true_to_force_template_rendering_to_fail = True
     for func in FUNCTIONS_TO_JUST_CALL:
         func()  # won't call the on_rendering_call
+
+
+def test_background_compilation():
+    from werkzeug.datastructures import ImmutableMultiDict
+    config, raw_config = parse_configuration({'base encoding': '{a}.', 'shows': 'a/0 ok/2', 'compilation': 'background access', 'users options': {'type': 'restricted', 'allowed': ('lucas', 'ada')}, 'choices options': {'choices': ['x', 'y']}}, filesource=__name__)
+    back = Backend('test', '', config, raw_config, render_template_func=lambda *a, **k: k)
+    assert back.compile_models_in_background(force_compilation=True)
+    back.background_compilation.result()
+    assert not back.recomputing
+    page = back.html_results()
+    assert page['generation'] == 1 and len(page['models']) == 2
+    back.set_user_choice('1', 0, ImmutableMultiDict([('choice', '3')]))
+    assert back.compile_models_in_background()
+    back.background_compilation.result()
+    page = back.html_results()
+    assert page['generation'] == 2 and all(('ok', (1, 4)) not in model.atoms for model in page['models'])
+
+
+
+def test_choices_changed_during_compilation():
+    import threading
+    from werkzeug.datastructures import ImmutableMultiDict
+    config, raw_config = parse_configuration({'base encoding': 'a.', 'shows': 'ok/2', 'users options': {'type': 'restricted', 'allowed': ('lucas', 'ada')}, 'choices options': {'choices': ['x', 'y']}}, filesource=__name__)
+    back = Backend('test', '', config, raw_config, render_template_func=lambda *a, **k: k)
+    back.set_user_choice('1', 0, ImmutableMultiDict([('choice', '3')]))
+    solving, resume = threading.Event(), threading.Event()
+    iter_models = back.iter_models
+    def slow_iter_models(*args, **kwargs):
+        solving.set()
+        resume.wait()
+        yield from iter_models(*args, **kwargs)
+    back.iter_models = slow_iter_models
+    compilation = threading.Thread(target=back.compile_models)
+    compilation.start()
+    solving.wait()
+    back.set_user_choice('1', 0, ImmutableMultiDict([('choice', '4')]))  # made while the previous choice is compiled
+    resume.set()
+    compilation.join()
+    assert ('ok', (1, 3)) in back.models[0].atoms and back.users_who_changed_their_choices == {'lucas'}
+    back.compile_models()
+    assert ('ok', (1, 4)) in back.models[0].atoms and not back.users_who_changed_their_choices and back.generation == 2
+
+def test_streamed_results():
+    from werkzeug.datastructures import ImmutableMultiDict
+    config, raw_config = parse_configuration({'base encoding': '{a(1..3)}.', 'shows': 'a/1', 'output options': {'streaming': True}, 'users options': {'type': 'restricted', 'allowed': ('lucas', 'ada')}, 'choices options': {'choices': ['x', 'y']}}, filesource=__name__)
+    def on_streaming_call(template, models, footer, **kwargs):
+        assert template == 'results.html'
+        return [m.uid for m in models], str(footer)
+    back = Backend('test', '', config, raw_config, stream_template_func=on_streaming_call)
+    asp.SOLVE_CACHE.clear()
+    back.set_user_choice('1', 0, ImmutableMultiDict([('choice', '3')]))
+    uids, footer = back.html_results()
+    assert len(uids) == len(back.models_uid) == 8
+    assert back.history[-1][1] == ['lucas'] and not back.users_who_changed_their_choices
+    assert footer.startswith('8 models found') and not back.models
+    assert len(asp.SOLVE_CACHE) == 0 and back.model_repr_key is None  # streamed models are not kept, even in caches
+
+
+def test_solving_limits():
+    config, raw_config = parse_configuration({
+        'base encoding': '1{a(1..9)}1. #maximize{X: a(X)}.', 'shows': 'a/1',
+        'users options': {'type': 'restricted', 'users': ('lucas', 'ada')},
+        'solver options': {'solving mode': 'optimals', 'model limit': 1, 'cache': False},
+    }, filesource=__name__)
+    back = Backend('test', '', config, raw_config)
+    back.compile_models(force_compilation=True)
+    assert len(back.models) == 1 and back.solving_infos == {'interrupted': True, 'optimality proven': False}
+    assert back.result_header.startswith(config['output options']['interruption message'])
+    assert back.history[-1][1] == ['autocompile']
+    assert back.history[-1][4]['interrupted'] and back.history[-1][4]['optimality proven'] is False
+
+
+def test_auto_compilation():
+    import time
+    from werkzeug.datastructures import ImmutableMultiDict
+    config, raw_config = parse_configuration({'base encoding': '{a}.', 'auto compilation delay': 0.05, 'users options': {'type': 'restricted', 'allowed': ('lucas', 'ada')}, 'choices options': {'choices': ['x', 'y']}}, filesource=__name__)
+    back = Backend('test', '', config, raw_config)
+    for choice in ('3', '4', '3'):  # a burst of choices leads to one compilation
+        back.set_user_choice('1', 0, ImmutableMultiDict([('choice', choice)]))
+    time.sleep(0.2)
+    back.background_compilation.result()
+    assert back.generation == 1 and not back.users_who_changed_their_choices
+
+
+
+def test_auto_compilation_during_compilation():
+    import time
+    import threading
+    from werkzeug.datastructures import ImmutableMultiDict
+    config, raw_config = parse_configuration({'base encoding': 'a.', 'shows': 'ok/2', 'auto compilation delay': 0.05, 'users options': {'type': 'restricted', 'allowed': ('lucas', 'ada')}, 'choices options': {'choices': ['x', 'y']}}, filesource=__name__)
+    back = Backend('test', '', config, raw_config)
+    solving, resume = threading.Event(), threading.Event()
+    iter_models = back.iter_models
+    def slow_iter_models(*args, **kwargs):
+        solving.set()
+        resume.wait()
+        yield from iter_models(*args, **kwargs)
+    back.iter_models = slow_iter_models
+    back.set_user_choice('1', 0, ImmutableMultiDict([('choice', '3')]))
+    assert solving.wait(timeout=5)
+    running = back.background_compilation
+    back.set_user_choice('1', 0, ImmutableMultiDict([('choice', '4')]))  # its compilation is queued after the running one
+    time.sleep(0.2)
+    assert back.background_compilation is not running
+    resume.set()
+    back.background_compilation.result()
+    assert back.generation == 2 and not back.users_who_changed_their_choices
+    assert ('ok', (1, 4)) in back.models[0].atoms and ('ok', (1, 3)) not in back.models[0].atoms
+
+def test_solver_statistics():
+    for engine in ('ASP/clingo', 'ASP/clingo module'):
+        config, raw_config = parse_configuration({
+            'base encoding': '{a(1..3)}.', 'shows': 'a/1',
+            'users options': {'type': 'restricted', 'allowed': ('lucas', 'ada')},
+            'output options': {'footer repr': [{'kind': 'text', 'text': '{solver_statistics["rules"]} rules'}]},
+            'solver options': {'engine': engine, 'cache': False},
+        }, filesource=__name__)
+        back = Backend('test', '', config, raw_config)
+        back.compile_models(force_compilation=True)
+        statistics = back.history[-1][4]
+        assert statistics['rules'] > 0 and statistics['choices'] >= 0 and statistics['solving time'] >= 0
+        assert statistics['compilation time'] >= statistics['python time'] >= 0
+        assert back.result_footer == f'{statistics["rules"]} rules'
+        assert back.statistics_totals['#compilations'] == 1
+
+
+def test_models_share_interned_atoms():
+    import hashname
+    from asp_model import model_stable_repr
+    config, raw_config = parse_configuration({'base encoding': '{a(1..3)}. b("x").', 'shows': 'a/1 b/1', 'users options': {'type': 'restricted', 'allowed': ('lucas', 'ada')}}, filesource=__name__)
+    back = Backend('test', '', config, raw_config)
+    back.compile_models(force_compilation=True)
+    assert len(back.models) == 8 and len({id(model.symbols) for model in back.models}) == 1
+    assert len(back.models[0].symbols.atoms) == 4  # a(1), a(2), a(3) and b("x"), stored once
+    for model in back.models:
+        assert model.atoms == model_stable_repr(frozenset(model.atoms)) and ('b', ('"x"',)) in model.atoms
+        assert model.uid == hashname.from_atoms(model.atoms)  # computed for all models at once
+
+
+def test_models_html_cache():
+    import asp_model
+    config, raw_config = parse_configuration({'base encoding': '{a(1..2)}.', 'shows': 'a/1', 'users options': {'type': 'restricted', 'allowed': ('lucas', 'ada')}}, filesource=__name__)
+    back = Backend('test', '', config, raw_config)
+    back.compile_models(force_compilation=True)
+    asp_model.HTML_CACHE.clear()
+    htmls = [model.html_repr() for model in back.models]
+    back.compile_models(force_compilation=True)  # same models are found again
+    hits = asp_model.HTML_CACHE.hits
+    assert [model.html_repr() for model in back.models] == htmls
+    assert asp_model.HTML_CACHE.hits == hits + len(htmls)
+
+
+def test_paginated_results():
+    config, raw_config = parse_configuration({'base encoding': '{a(1..3)}.', 'shows': 'a/1', 'output options': {'models per page': 3}, 'users options': {'type': 'restricted', 'allowed': ('lucas', 'ada')}}, filesource=__name__)
+    back = Backend('test', '', config, raw_config, render_template_func=lambda *a, **k: k)
+    back.compile_models(force_compilation=True)
+    page = back.html_results()
+    assert [m.idx for m in page['models']] == [1, 2, 3] and page['pagination'] == {'page': 1, 'nb_pages': 3, 'limit': 3}
+    with Flask(__name__).test_request_context('/results?page=3&limit=3'):
+        page = back.html_results()
+    assert [m.idx for m in page['models']] == [7, 8]
+    with Flask(__name__).test_request_context('/results?page=9&limit=invalid'):
+        assert back.html_results()['pagination'] == {'page': 3, 'nb_pages': 3, 'limit': 3}
+
+
+def test_pareto_front_flags_optimal_models():
+    encoding = '{m(1..4)} = 1. a(X) :- m(X). b(3) :- m(1). b(2) :- m(2). b(1) :- m(3). b(2) :- m(4).'
+    plugin = {'kind': 'pareto front', 'x': 'a', 'y': 'b', 'model optimality flag': 'OPTIMAL'}
+    config, raw_config = parse_configuration({'base encoding': encoding, 'shows': 'a/1 b/1', 'output options': {'plugin repr': [plugin]}, 'users options': {'type': 'restricted', 'allowed': ('lucas', 'ada')}}, filesource=__name__)
+    back = Backend('test', '', config, raw_config)
+    back.compile_models(force_compilation=True)
+    optimal = {dict(model.atoms)['a'][0] for model in back.models if 'OPTIMAL' in model.html_repr()}
+    assert optimal == {1, 4}  # (4, 2) dominates (2, 2) and (3, 1), not (1, 3)
+
+
+def test_parallel_rendering():
+    import bakasp_backend
+    encoding = '{m(1..4)} = 1. a(X) :- m(X). b(3) :- m(1). b(2) :- m(2). b(1) :- m(3). b(2) :- m(4).'
+    output = {'plugin repr': [{'kind': 'pareto front', 'x': 'a', 'y': 'b', 'model optimality flag': 'OPTIMAL'}], 'models per page': 3}
+    htmls = {}
+    for parallel in (False, True):
+        config, raw_config = parse_configuration({'base encoding': encoding, 'shows': 'a/1 b/1', 'output options': {**output, 'parallel rendering': parallel}, 'users options': {'type': 'restricted', 'allowed': ('lucas', 'ada')}}, filesource=__name__)
+        back = Backend('test', '', config, raw_config, render_template_func=lambda *a, **k: k)
+        back.compile_models(force_compilation=True)
+        assert [model.html is not None for model in back.models] == [parallel] * 3 + [False]  # first page rendered at compilation
+        with Flask(__name__).test_request_context('/results?page=2'):
+            back.html_results()
+        htmls[parallel] = [model.html_repr() for model in back.models]
+    assert htmls[True] == htmls[False] and sum('OPTIMAL' in html for html in htmls[True]) == 2
+
+
+def test_parallel_rendering_reuses_html_cache():
+    import asp_model
+    config, raw_config = parse_configuration({'base encoding': '{a(1..2)}.', 'shows': 'a/1', 'output options': {'parallel rendering': True}, 'users options': {'type': 'restricted', 'allowed': ('lucas', 'ada')}}, filesource=__name__)
+    back = Backend('test', '', config, raw_config)
+    asp_model.HTML_CACHE.clear()
+    back.compile_models(force_compilation=True)
+    htmls = [model.html_repr() for model in back.models]
+    rendered = []
+    back.render_pure_parts = lambda models: rendered.extend(models) or [[] for _ in models]
+    back.compile_models(force_compilation=True)  # same models are found again, with their html in cache
+    assert not rendered and [model.html_repr() for model in back.models] == htmls
+
+
+def test_unrestricted_users():
+    config, raw_config = parse_configuration({'base encoding': '{a}.', 'users options': {'type': 'valid-id'}}, filesource=__name__)
+    back = Backend('test', '', config, raw_config, render_template_func=lambda *a, **k: k)
+    assert isinstance(back.user_choices, list)  # no known users
+    back.compile_models(force_compilation=True)
+    assert len(back.models) == 2
@@ -0,0 +1,17 @@
+import threading
+from scheduler import CompilationScheduler
+
+
+def test_fairness_and_coalescing():
+    scheduler = CompilationScheduler(max_workers=1, fairness='weighted')
+    running, started, order = threading.Event(), threading.Event(), []
+    scheduler.submit('blocker', lambda: running.set() or started.wait())
+    running.wait()
+    # while the only worker is busy, instance a asks many times, and b, c once
+    futures = [scheduler.submit(key, lambda key=key: order.append(key), weight) for key, weight in (('a', 10), ('a', 10), ('b', 1), ('c', 1))]
+    assert futures[0] is futures[1] and scheduler.coalesced == 1
+    assert scheduler.stats()['#compilations queued'] == 3
+    started.set()
+    for future in futures:
+        future.result()
+    assert order == ['b', 'c', 'a']  # cheapest first
@@ -0,0 +1,250 @@
+import os
+import pytest
+import utils
+
+
+ENCODING = '1{a(1..3)}1. b("x y",c,-d,(1,2)) :- a(X).  #maximize{X: a(X)}.'
+
+
+def as_sorted(models) -> list:
+    "Sorting frozensets is done by inclusion, which is not a total order"
+    return sorted(sorted(model) for model in models)
+
+
+def test_engines_agree():
+    if utils.clingo is None:
+        pytest.skip("clingo python module is not available")
+    for optimals_only in (False, True):
+        binary = utils.call_ASP_solver(ENCODING, n=0, sampling=False, cli_options=[], optimals_only=optimals_only)
+        module = utils.call_clingo_module(ENCODING, n=0, sampling=False, cli_options=[], optimals_only=optimals_only)
+        assert as_sorted(binary) == as_sorted(module)
+
+
+def test_solve_cache(monkeypatch):
+    import asp
+    from config import parse_configuration
+    cfg, _ = parse_configuration({'base encoding': '{a(1..2)}.', 'users options': {'type': 'restricted', 'allowed': ['ada']}}, filesource=__name__)
+    asp.SOLVE_CACHE.clear()
+    first = as_sorted(asp.solve_encoding(cfg, {}))
+    assert len(first) == 4
+    def no_solver_call(*args, **kwargs):
+        assert False, "the solver shouldn't have been called for an already solved encoding"
+    monkeypatch.setattr(asp, 'solve', no_solver_call)
+    assert as_sorted(asp.solve_encoding(cfg, {})) == first
+
+
+def test_incremental_session():
+    if utils.clingo is None:
+        pytest.skip("clingo python module is not available")
+    import asp
+    from config import parse_configuration
+    cfg, _ = parse_configuration({
+        'base encoding file': 'data/asp/making-teams.lp', 'shows': 'team/2',
+        'users options': {'type': 'restricted', 'allowed': ['a', 'b', 'c', 'd']},
+        'choices options': {'type': 'multiple users', 'default': 'none'},
+        'solver options': {'engine': 'ASP/clingo module', 'solving mode': 'optimals', 'incremental': True, 'cache': False},
+    }, filesource=__name__)
+    session = asp.SolvingSession(cfg)
+    for user_choices in ({'1': [['2']], '2': [[]], '3': [['4']], '4': [[]]}, {'1': [['3']], '2': [[]], '3': [[]], '4': [['2']]}):
+        expected = as_sorted(asp.solve_encoding(cfg, user_choices))
+        assert as_sorted(asp.solve_encoding(cfg, user_choices, session=session)) == expected
+
+
+def test_parallel_profiles():
+    import asp
+    from config import parse_configuration
+    for engine, incremental in (('ASP/clingo', False), ('ASP/clingo module', False), ('ASP/clingo module', True)):
+        if engine == 'ASP/clingo module' and utils.clingo is None:
+            continue
+        cfg, _ = parse_configuration({
+            'base encoding': '{a(1..3)}.', 'shows': 'a/1', 'users options': {'type': 'restricted', 'allowed': ['ada']},
+            'solver options': {'engine': engine, 'incremental': incremental, 'parallel': 'portfolio', 'threads': 2, 'cache': False},
+        }, filesource=__name__)
+        infos = {}
+        session = asp.SolvingSession(cfg) if incremental else None
+        assert len(list(asp.solve_encoding(cfg, {'1': [[]]}, session=session, infos=infos))) == 8
+        assert infos['threads'] >= 1 and asp.THREAD_BUDGET.running == 0
+
+
+def test_thread_budget_is_not_oversubscribed():
+    import asp
+    import threading
+    budget, granted = asp.ThreadBudget(2), []
+    assert budget.acquire(0) == 2
+    waiting = threading.Thread(target=lambda: granted.append(budget.acquire(0)))
+    waiting.start()
+    waiting.join(0.1)
+    assert waiting.is_alive() and not granted  # no thread is free
+    budget.release(2)
+    waiting.join(1)
+    assert granted == [2] and budget.allocated == 2
+
+
+
+def test_sequential_solvings_take_a_thread(monkeypatch):
+    import asp
+    import threading
+    from config import parse_configuration
+    budget = asp.ThreadBudget(1)
+    monkeypatch.setattr(asp, 'THREAD_BUDGET', budget)
+    for engine, incremental in (('ASP/clingo', False), ('ASP/clingo module', False), ('ASP/clingo module', True)):
+        if engine == 'ASP/clingo module' and utils.clingo is None:
+            continue
+        cfg, _ = parse_configuration({
+            'base encoding': '{a}.', 'users options': {'type': 'restricted', 'allowed': ['ada']},
+            'solver options': {'engine': engine, 'incremental': incremental, 'cache': False},
+        }, filesource=__name__)
+        session = asp.SolvingSession(cfg) if incremental else None
+        threads, found = budget.acquire(0), []  # e.g. taken by a parallel solving
+        solving = threading.Thread(target=lambda: found.extend(asp.solve_encoding(cfg, {'1': [[]]}, session=session)))
+        solving.start()
+        solving.join(0.2)
+        assert solving.is_alive() and not found
+        budget.release(threads)
+        solving.join(5)
+        assert len(found) == 2 and budget.allocated == 0
+
+def test_sampling_is_not_first_models():
+    import asp
+    from config import parse_configuration
+    cfg, _ = parse_configuration({
+        'base encoding': '{a(1..12)}.', 'shows': 'a/1', 'users options': {'type': 'restricted', 'allowed': ['ada']},
+        'output options': {'max models': 3, 'model selection': 'sampling', 'sampling pool': 50},
+    }, filesource=__name__)
+    first = as_sorted(asp.solve_encoding(dict(cfg, **{'output options': dict(cfg['output options'], **{'model selection': 'first'})}), {}))
+    samples = [as_sorted(asp.solve_encoding(cfg, {})) for _ in range(5)]
+    assert all(len(sample) == 3 for sample in samples)
+    assert any(sample != first for sample in samples)
+    assert len(set(map(repr, samples))) > 1
+
+
+def test_incremental_session_assigns_only_changed_externals():
+    if utils.clingo is None:
+        pytest.skip("clingo python module is not available")
+    import asp
+    from config import parse_configuration
+    cfg, _ = parse_configuration({
+        'base encoding file': 'data/asp/one-to-one-assoc.lp', 'shows': 'assoc/2',
+        'users options': {'type': 'restricted', 'allowed': ['a', 'b', 'c']}, 'choices options': {'choices': ['x', 'y', 'z']},
+        'solver options': {'engine': 'ASP/clingo module', 'incremental': True, 'cache': False},
+    }, filesource=__name__ + '-externals')
+    session = asp.SolvingSession(cfg)
+    list(session.solve({'1': [['4']], '2': [['5']], '3': [['6']]}))
+    ctl, assigned = asp.GROUND_CACHE.get(session.ground_key).ctl, []
+    assign_external = ctl.assign_external
+    ctl.assign_external = lambda symbol, value: (assigned.append((str(symbol), value)), assign_external(symbol, value))
+    user_choices = {'1': [['4']], '2': [['6']], '3': [['6']]}
+    assert as_sorted(session.solve(user_choices)) == as_sorted(asp.solve_encoding(cfg, user_choices))
+    assert sorted(assigned) == [('ok(2,5)', False), ('ok(2,6)', True)]
+
+
+def test_shared_ground_programs():
+    if utils.clingo is None:
+        pytest.skip("clingo python module is not available")
+    import asp
+    from config import parse_configuration
+    def make_cfg():
+        return parse_configuration({
+            'base encoding file': 'data/asp/one-to-one-assoc.lp', 'shows': 'assoc/2',
+            'users options': {'type': 'restricted', 'allowed': ['a', 'b']}, 'choices options': {'choices': ['x', 'y']},
+            'solver options': {'engine': 'ASP/clingo module', 'incremental': True, 'cache': False},
+        }, filesource=__name__)[0]
+    first, second = asp.SolvingSession(make_cfg()), asp.SolvingSession(make_cfg())
+    assert len(list(first.solve({'1': [['3', '4']], '2': [['3', '4']]}))) == 2
+    assert len(list(second.solve({'1': [['3']], '2': [['4']]}))) == 1
+    assert first.ground_key == second.ground_key and first.ground_key in asp.GROUND_CACHE
+
+
+def test_ground_program_settings_are_not_shared(monkeypatch):
+    if utils.clingo is None:
+        pytest.skip("clingo python module is not available")
+    import asp
+    monkeypatch.setattr(asp, 'THREAD_BUDGET', asp.ThreadBudget(2))
+    from config import parse_configuration
+    def make_session(output_options: dict, solver_options: dict = {}):
+        return asp.SolvingSession(parse_configuration({
+            'base encoding': '{a(1..10)}.', 'users options': {'type': 'restricted', 'allowed': ['a']},
+            'output options': {'max models': 3, **output_options},
+            'solver options': {'engine': 'ASP/clingo module', 'incremental': True, 'cache': False, **solver_options},
+        }, filesource=__name__)[0])
+    sampling, first = make_session({'model selection': 'sampling', 'sampling pool': 50}), make_session({})
+    assert len(list(sampling.solve({'1': [[]]}))) == 3
+    assert len(list(first.solve({'1': [[]]}))) == 3 and sampling.ground_key == first.ground_key
+    assert asp.GROUND_CACHE.get(first.ground_key).ctl.configuration.solve.models == '3'
+    compete, sequential = make_session({}, {'parallel': 'compete', 'threads': 2}), make_session({}, {'parallel': 'none'})
+    list(compete.solve({'1': [[]]}))
+    assert asp.GROUND_CACHE.get(compete.ground_key).ctl.configuration.solve.parallel_mode == '2,compete'
+    list(sequential.solve({'1': [[]]}))
+    assert asp.GROUND_CACHE.get(sequential.ground_key).ctl.configuration.solve.parallel_mode == '1,compete'
+    assert asp.GROUND_CACHE.get(sequential.ground_key).ctl.configuration.solver.sign_def == 'asp'
+
+
+def test_compact_encoding():
+    import asp
+    from config import parse_configuration
+    def solve(compact: bool):
+        cfg = parse_configuration({
+            'base encoding file': 'data/asp/one-to-one-assoc.lp', 'shows': 'assoc/2',
+            'users options': {'type': 'restricted', 'allowed': ['a', 'b', 'c']}, 'choices options': {'choices': ['x', 'y', 'z']},
+            'solver options': {'compact encoding': compact, 'cache': False},
+        }, filesource=__name__)[0]
+        user_choices = {'1': [['4', '5']], '2': [['4', '6']], '3': [['5']]}
+        return asp.compute_encoding(cfg, user_choices), as_sorted(asp.solve_encoding(cfg, user_choices))
+    (compact_encoding, compact_models), (encoding, models) = solve(True), solve(False)
+    assert len(compact_encoding) < len(encoding)
+    assert compact_models == models and models
+
+
+def running_children() -> list:
+    "Return the pids of the running child processes, zombies excepted"
+    pids = []
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            with open(f'/proc/{pid}/stat') as fd:
+                state, ppid = fd.read().rsplit(')', 1)[1].split()[:2]
+        except OSError:  # process ended meanwhile
+            continue
+        if int(ppid) == os.getpid() and state != 'Z':
+            pids.append(pid)
+    return pids
+
+
+def test_model_limit_stops_the_solver():
+    if not os.path.isdir('/proc'):
+        pytest.skip("child processes are listed with /proc")
+    hard = '{p(1..60)}. :- p(X), p(Y), p(Z), X+Y==Z. #maximize{X: p(X)}.'
+    infos = {}
+    models = list(utils.call_ASP_solver(hard, n=0, sampling=False, cli_options=[], optimals_only=True, model_limit=2, infos=infos))
+    assert len(models) == 1 and infos['interrupted'] and not running_children()
+    # models are not wanted anymore
+    solving = utils.call_ASP_solver(hard, n=0, sampling=False, cli_options=[])
+    next(solving)
+    solving.close()
+    assert not running_children()
+    # the limit doesn't interrupt a solving finding exactly that many models
+    infos = {}
+    assert len(list(utils.call_ASP_solver('{a(1..10)}.', n=5, sampling=False, cli_options=[], model_limit=5, infos=infos))) == 5
+    assert not infos['interrupted']
+    infos = {}
+    assert len(list(utils.call_ASP_solver('{a(1..10)}.', n=0, sampling=False, cli_options=[], model_limit=5, infos=infos))) == 5
+    assert infos['interrupted'] and not running_children()
+
+
+def test_time_limit_includes_grounding():
+    if utils.clingo is None:
+        pytest.skip("clingo python module is not available")
+    import time
+    import asp
+    from config import parse_configuration
+    slow_grounding = 'p(1..170). q(X,Y,Z) :- p(X), p(Y), p(Z), X<Y, Y<Z.'
+    hard = 'pigeon(1..12). hole(1..11). 1{at(P,H): hole(H)}1 :- pigeon(P). :- at(P1,H), at(P2,H), P1<P2.'
+    for incremental in (False, True):
+        cfg, _ = parse_configuration({
+            'base encoding': slow_grounding + hard, 'users options': {'type': 'restricted', 'allowed': ['ada']},
+            'solver options': {'engine': 'ASP/clingo module', 'incremental': incremental, 'time limit': 1, 'cache': False},
+        }, filesource=__name__)
+        infos = {}
+        session = asp.SolvingSession(cfg) if incremental else None
+        starttime = time.time()
+        assert not list(asp.solve_encoding(cfg, {}, session=session, infos=infos)) and infos['interrupted']
+        assert time.time() - starttime < max(1, infos['statistics']['grounding time']) + 0.4  # not grounding time plus time limit
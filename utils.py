@@ -4,9 +4,15 @@ import re
 import time
 import random
 import clyngor
+import subprocess
 from flask import Flask, Blueprint
 from itertools import zip_longest
 
+try:
+    import clingo
+except ImportError:  # the in-process engine will not be available
+    clingo = None
+
 clyngor.use_clingo_binary()
 
 
@@ -32,23 +38,289 @@ def filestate_from_uid_and_cfg(uid: str, cfg: dict):
     return base.replace('.json', '---' + uid + '.json') if uid else base
 
 
-def call_ASP_solver(encoding: str, n: int, sampling: bool, cli_options: list = [], constants: dict = {}, optimals_only: bool = False, clingo_bin_path: str = 'clingo') -> [frozenset]:
-    "Call to the ASP solver with given encoding and n/sampling config values"
+def call_ASP_solver(encoding: str, n: int, sampling: bool, cli_options: list = [], constants: dict = {}, optimals_only: bool = False, clingo_bin_path: str = 'clingo',
+                    time_limit: int = 0, model_limit: int = 0, sampling_pool: int = 0, infos: dict = None) -> [frozenset]:
+    """Call to the ASP solver with given encoding and n/sampling config values
+
+    When sampling, n models are drawn among the sampling_pool first models (all if zero)
+    found by a randomized solver.
+    Solving is stopped after time_limit seconds or model_limit models, if non-zero.
+    See anytime_models for the models yielded in that case, and the content of infos dict.
 
+    """
+    infos = {} if infos is None else infos
     if optimals_only:
         if '--opt-mode=optN' not in cli_options:
             cli_options.append('--opt-mode=optN')
-        converter = lambda ms: list(clyngor.opt_models_from_clyngor_answers(ms))
+    if sampling and n:
+        cli_options = [*cli_options, *randomization_cli_options()]
+        nb_model = sampling_pool
+    else:
+        nb_model = n
+
+    if model_limit and not optimals_only:  # clingo stops by itself once it is known whether the limit stopped it
+        nb_model = min(nb_model or model_limit + 1, model_limit + 1)
+    answers, process = clingo_process(encoding, nb_model=int(nb_model), options=cli_options, constants=constants, clingo_bin_path=clingo_bin_path, time_limit=int(time_limit))
+    def gen_answers():
+        # with optN, clingo yields improving models, then the optimal ones, starting again at answer 1
+        #  (see clyngor.opt_models_from_clyngor_answers)
+        first_seen, optimum_reached = False, False
+        for model, _, _, answer_number in answers.with_answer_number:
+            if answer_number == 1 and first_seen:
+                optimum_reached = True
+            first_seen = True
+            yield model, optimum_reached
+        if answers.statistics.get('TIME LIMIT') == '1':
+            infos['interrupted'] = True
+        if statistics := statistics_from_clasp_output(answers.statistics):
+            infos['statistics'] = statistics
+
+    try:
+        models = anytime_models(gen_answers(), optimals_only, model_limit, infos)
+        if sampling and n:
+            models = reservoir_sample(models, n)
+        yield from models  # models are yielded as soon as clingo outputs them
+    finally:  # clingo is still running if solving was stopped by the model limit, or models are not wanted anymore
+        stop_process(process)
+
+
+def clingo_process(encoding: str, **solve_options) -> (clyngor.Answers, subprocess.Popen):
+    """Return the answers of the clingo binary run on given encoding, like clyngor.solve does,
+    and the clingo process, so that it can be stopped before its end.
+
+    Given solve options are those of clyngor.command.
+
+    """
+    process = subprocess.Popen(clyngor.command(**solve_options), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    process.stdin.write(encoding.encode())
+    process.stdin.close()
+    stdout = (line.decode() for line in process.stdout)
+    stderr = (line.decode() for line in process.stderr)
+    statistics = {}  # filled by clyngor while reading the output
+    # the output is parsed like clyngor.solve parses it, including errors raised from stderr
+    return clyngor.Answers(clyngor.solving._gen_answers(stdout, stderr, statistics, False),
+                           statistics=statistics, with_optimization=True), process
+
+
+def stop_process(process: subprocess.Popen):
+    "Kill given process if still running, and wait for its end, so it doesn't stay as a zombie"
+    if process.poll() is None:
+        process.kill()
+    process.wait()
+    process.stdout.close()
+    process.stderr.close()
+
+
+def call_clingo_module(encoding: str, n: int, sampling: bool, cli_options: list = [], constants: dict = {}, optimals_only: bool = False,
+                       time_limit: int = 0, model_limit: int = 0, sampling_pool: int = 0, infos: dict = None) -> [frozenset]:
+    """Ground and solve given encoding in-process with the clingo python API.
+
+    Yield models in the same form as call_ASP_solver, i.e. frozensets of (predicate, args),
+    but without spawning a clingo process nor parsing its textual output.
+
+    """
+    deadline = (time.time() + time_limit) if time_limit else None  # grounding is counted, like the clingo binary does
+    if sampling and n:
+        ctl = clingo_control(sampling_pool, [*cli_options, *randomization_cli_options()], constants, optimals_only)
     else:
-        converter = list
+        ctl = clingo_control(n, cli_options, constants, optimals_only)
+    ctl.add('base', [], encoding)
+    ctl.ground([('base', [])])
+    yield from models_from_control(ctl, n, sampling, optimals_only, deadline=deadline, model_limit=model_limit, infos=infos)
+
+
+def clingo_control(n: int, cli_options: list = [], constants: dict = {}, optimals_only: bool = False) -> object:
+    "Return a clingo Control object configured like call_ASP_solver configures the clingo binary"
+    if clingo is None:
+        raise ImportError("The clingo python module is required by the 'ASP/clingo module' engine.")
+    options = [*cli_options, f'--models={int(n)}', *(f'--const={name}={value}' for name, value in constants.items())]
+    if optimals_only and '--opt-mode=optN' not in options:
+        options.append('--opt-mode=optN')
+    return clingo.Control(options, logger=lambda code, msg: None)
 
-    models = converter(clyngor.solve(inline=encoding, nb_model=int(n), options=cli_options, constants=constants, clingo_bin_path=clingo_bin_path))
-    if sampling:
-        if len(models) > n:
-            models = random.sample(models, n)
+
+def models_from_control(ctl: object, n: int, sampling: bool, optimals_only: bool = False, *,
+                        deadline: float = None, model_limit: int = 0, infos: dict = None) -> [frozenset]:
+    """Solve with given grounded clingo Control object, yield models as frozensets of (predicate, args)
+
+    Solving is stopped at given deadline, as given by time.time(), if any.
+
+    """
+    infos = {} if infos is None else infos
+    def gen_answers():
+        try:
+            with ctl.solve(yield_=True, async_=True) as handle:
+                while True:
+                    handle.resume()
+                    if not handle.wait(None if deadline is None else max(0., deadline - time.time())):
+                        handle.cancel()
+                        infos['interrupted'] = True
+                        break
+                    model = handle.model()
+                    if model is None:
+                        break
+                    yield frozenset((sym.name, tuple(map(clyngor_arg_from_symbol, sym.arguments))) for sym in model.symbols(shown=True)), model.optimality_proven
+        finally:  # statistics are available even when solving is stopped early
+            if statistics := statistics_from_control(ctl.statistics):
+                infos['statistics'] = statistics
+
+    models = anytime_models(gen_answers(), optimals_only, model_limit, infos)
+    if sampling and n:
+        models = reservoir_sample(models, n)
     yield from models
 
 
+def solver_statistics(rules: int, atoms: int, choices: int, conflicts: int, total_time: float, solving_time: float, proof_time: float) -> dict:
+    "Return the statistics of a solving, as stored in solving infos under 'statistics'"
+    return {
+        'rules': int(rules), 'atoms': int(atoms), 'choices': int(choices), 'conflicts': int(conflicts),
+        'total time': total_time, 'grounding time': max(0., total_time - solving_time),
+        'solving time': solving_time, 'proof time': proof_time,
+    }
+
+
+def statistics_from_clasp_output(stats: dict) -> dict:
+    """Return the statistics printed by the clingo binary, as parsed by clyngor
+
+    The proof time is the time spent after the last model, e.g. to prove optimality.
+
+    >>> stats = statistics_from_clasp_output({'Time': '0.50s (Solving: 0.25s 1st Model: 0.00s Unsat: 0.12s)', 'Choices': '5', 'Conflicts': '3        (Analyzed: 3)', 'Rules': '4', 'Atoms': '3'})
+    >>> stats['rules'], stats['conflicts'], stats['grounding time'], stats['proof time']
+    (4, 3, 0.25, 0.12)
+    >>> statistics_from_clasp_output({})
+    {}
+
+    """
+    if not stats.get('Time'):  # solving was stopped before clingo printed its statistics
+        return {}
+    number = lambda name: stats.get(name, '0').split()[0]
+    times = dict(re.findall(r'(\w+): ([\d.]+)s', stats['Time']))
+    return solver_statistics(
+        number('Rules'), number('Atoms'), number('Choices'), number('Conflicts'),
+        float(stats['Time'].split('s')[0]), float(times.get('Solving', 0.)), float(times.get('Unsat', 0.)),
+    )
+
+
+def statistics_from_control(stats: dict) -> dict:
+    "Return the statistics of the last solving of a clingo Control object, given its statistics"
+    try:
+        times = stats['summary']['times']
+        return solver_statistics(
+            stats['problem']['lp']['rules'], stats['problem']['lp']['atoms'],
+            stats['solving']['solvers']['choices'], stats['solving']['solvers']['conflicts'],
+            times['total'], times['solve'], times['unsat'],
+        )
+    except KeyError:  # no solving happened
+        return {}
+
+
+def randomization_cli_options() -> list[str]:
+    "Return clingo options making it explore the search space randomly, with a new seed each time"
+    return [f'--seed={random.randrange(2**31)}', '--sign-def=rnd', '--rand-freq=0.2']
+
+
+def reservoir_sample(items: iter, n: int) -> list:
+    """Return n items drawn uniformly from given ones, keeping only n of them in memory
+
+    >>> sorted(reservoir_sample(range(3), 5))
+    [0, 1, 2]
+    >>> sample = reservoir_sample(range(1000), 10)
+    >>> len(sample), len(set(sample)), all(0 <= i < 1000 for i in sample)
+    (10, 10, True)
+
+    """
+    sample = []
+    for idx, item in enumerate(items):
+        if idx < n:
+            sample.append(item)
+        elif (replaced := random.randrange(idx + 1)) < n:
+            sample[replaced] = item
+    return sample
+
+
+def anytime_models(answers: iter, optimals_only: bool, model_limit: int, infos: dict) -> [frozenset]:
+    """Yield models from given (model, optimality proven) pairs, stopping after model_limit of them if non-zero.
+
+    If optimals_only, only the models of proven optimality are yielded,
+    unless solving is stopped before the optimum is proven:
+    the best model found so far is then yielded.
+    Given infos dict is updated with 'interrupted', and 'optimality proven' if optimals_only.
+    Solving is considered interrupted by the model limit only if there is another answer after it.
+
+    >>> infos = {}
+    >>> list(anytime_models(iter([('a', False), ('b', True), ('c', True)]), True, 0, infos)), infos
+    (['b', 'c'], {'interrupted': False, 'optimality proven': True})
+    >>> infos = {}
+    >>> list(anytime_models(iter([('a', False), ('b', False), ('c', True)]), True, 2, infos)), infos
+    (['b'], {'interrupted': True, 'optimality proven': False})
+    >>> infos = {}
+    >>> list(anytime_models(iter([('a', False), ('b', False), ('c', False)]), False, 2, infos)), infos
+    (['a', 'b'], {'interrupted': True})
+    >>> infos = {}
+    >>> list(anytime_models(iter([('a', False), ('b', False)]), False, 2, infos)), infos
+    (['a', 'b'], {'interrupted': False})
+
+    """
+    infos['interrupted'] = False
+    if optimals_only:
+        infos['optimality proven'] = False
+    answers = iter(answers)
+    best, nb_answers = None, 0
+    for model, optimality_proven in answers:
+        nb_answers += 1
+        if not optimals_only or optimality_proven:
+            if optimals_only:
+                infos['optimality proven'] = True
+            yield model
+        else:  # an improving model, better than the previous ones
+            best = model
+        if model_limit and nb_answers >= model_limit:
+            # the solver had more to give if optimum was not reached yet, or if there is another answer
+            if (optimals_only and not infos['optimality proven']) or next(answers, None) is not None:
+                infos['interrupted'] = True
+            break
+    if optimals_only and infos['interrupted'] and not infos['optimality proven'] and best is not None:
+        yield best
+
+
+def clyngor_arg_from_symbol(symbol: object) -> int | str | tuple:
+    """Return the python value clyngor would have parsed for given clingo symbol
+
+    >>> clyngor_arg_from_symbol(clingo.Number(3)), clyngor_arg_from_symbol(clingo.String('a b'))
+    (3, '"a b"')
+    >>> clyngor_arg_from_symbol(clingo.Function('c', positive=False))
+    '-c'
+    >>> clyngor_arg_from_symbol(clingo.Tuple_([clingo.Number(1), clingo.Function('a')]))
+    ('', (1, 'a'))
+
+    """
+    if symbol.type == clingo.SymbolType.Number:
+        return symbol.number
+    elif symbol.type == clingo.SymbolType.Function and symbol.name == '' and symbol.arguments:  # tuple
+        return '', tuple(map(clyngor_arg_from_symbol, symbol.arguments))
+    elif symbol.type == clingo.SymbolType.Infimum:
+        return 'inf'
+    elif symbol.type == clingo.SymbolType.Supremum:
+        return 'sup'
+    else:  # strings keep their quotes, functions are kept as text, like clyngor does
+        return str(symbol)
+
+
+class Lazy:
+    """Markup-like object, computed by given function only when rendered
+
+    >>> lazy = Lazy(lambda: '<b>done</b>')
+    >>> lazy.__html__()
+    '<b>done</b>'
+
+    """
+    def __init__(self, func: callable):
+        self.func = func
+    def __html__(self) -> str:
+        return str(self.func())
+    __str__ = __html__
+
+
 def by_chunks(iterable, n, fillvalue=None):
     """Collect data into fixed-length chunks or blocks
 